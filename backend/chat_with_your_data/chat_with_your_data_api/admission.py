@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from . import metrics
+
+# Endpoint classes doing heavy model work, with their default limits per
+# worker process. ADMISSION_<CLASS>_CONCURRENCY and ADMISSION_<CLASS>_QUEUE
+# override them, e.g. ADMISSION_SUMMARIZE_CONCURRENCY=1.
+DEFAULT_LIMITS = {
+    "summarize": (1, 4),
+    "upload": (2, 8),
+    "reload": (1, 2),
+    "search": (4, 16),
+}
+
+__queue_timeout = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+__retry_after = int(os.getenv("ADMISSION_RETRY_AFTER", 10))
+
+
+class Rejected(Exception):
+    def __init__(self, status, retry_after):
+        super().__init__(f"Rejected with status {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class AdmissionLimit:
+    """
+    Lets at most concurrency requests of an endpoint class run at once and
+    at most queue_size more wait for a slot. A request is rejected with 429
+    when the queue is full, and with 503 when it waited queue_timeout seconds
+    without getting a slot; both tell the client to retry after retry_after
+    seconds.
+    """
+
+    def __init__(self, name, concurrency, queue_size, queue_timeout, retry_after):
+        self.name = name
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.waiting = 0
+        self.__slots = threading.BoundedSemaphore(concurrency)
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def admit(self):
+        if not self.__slots.acquire(blocking=False):
+            self.__wait()
+        metrics.add_gauge(f"admission_in_flight.{self.name}", 1)
+        try:
+            yield
+        finally:
+            metrics.add_gauge(f"admission_in_flight.{self.name}", -1)
+            self.__slots.release()
+
+    def __wait(self):
+        with self.__lock:
+            if self.waiting >= self.queue_size:
+                self.__reject(429)
+            self.waiting += 1
+
+        start = time.perf_counter()
+        try:
+            acquired = self.__slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self.__lock:
+                self.waiting -= 1
+        metrics.observe(f"admission_wait_seconds.{self.name}", time.perf_counter() - start)
+        if not acquired:
+            self.__reject(503)
+
+    def __reject(self, status):
+        metrics.inc(f"admission_rejected.{self.name}.{status}")
+        raise Rejected(status, self.retry_after)
+
+
+def __limit(name):
+    default_concurrency, default_queue = DEFAULT_LIMITS[name]
+    return AdmissionLimit(
+        name,
+        int(os.getenv(f"ADMISSION_{name.upper()}_CONCURRENCY", default_concurrency)),
+        int(os.getenv(f"ADMISSION_{name.upper()}_QUEUE", default_queue)),
+        __queue_timeout,
+        __retry_after,
+    )
+
+
+limits = {name: __limit(name) for name in DEFAULT_LIMITS}
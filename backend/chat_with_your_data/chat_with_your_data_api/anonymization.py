@@ -0,0 +1,146 @@
+from django.db import transaction
+
+from .embedding import (deserialize_doc, embed_text, generate_pseudo,
+                        sentence_entities, serialize_doc)
+from .context import window_filter
+from .models import AnonymizeEntitie, Document, Room, SectionEntity
+
+
+class RoomEntityMapping:
+    """
+    Anonymization mappings of one room.
+
+    add() collects the entities of a request; save() gives the new ones a
+    pseudonym from the per-label counter maxima and writes them with one
+    bulk insert.
+    """
+
+    def __init__(self, room):
+        self.room = room
+        self.mapping = {}
+        self.counters = {}
+        self.pending = {}
+
+    def add(self, text, label):
+        self.pending.setdefault(text, label)
+
+    def save(self):
+        if not self.pending:
+            return
+        with transaction.atomic():
+            # Concurrent requests would otherwise allocate the same pseudonym
+            # for different entities; the maxima are read under the room lock
+            Room.objects.select_for_update().get(id=self.room.id)
+            self.__load()
+            entities = []
+            for text, label in self.pending.items():
+                if text in self.mapping:
+                    continue
+                counter = self.counters.get(label, 0)
+                anonymized = generate_pseudo(label, counter)
+                self.counters[label] = counter + 1
+                self.mapping[text] = anonymized
+                entities.append(
+                    AnonymizeEntitie(
+                        roomID=self.room,
+                        anonymized=anonymized,
+                        deanonymized=text,
+                        entityType=label,
+                        counter=counter + 1,
+                    )
+                )
+            AnonymizeEntitie.objects.bulk_create(entities)
+        self.pending = {}
+
+    def __load(self):
+        self.mapping = {}
+        self.counters = {}
+        for deanonymized, anonymized, entity_type, counter in (
+            AnonymizeEntitie.objects.filter(roomID=self.room).values_list(
+                "deanonymized", "anonymized", "entityType", "counter"
+            )
+        ):
+            self.mapping[deanonymized] = anonymized
+            self.counters[entity_type] = max(self.counters.get(entity_type, 0), counter)
+
+
+def load_embedded_text(document):
+    """Returns the parsed spaCy document, parsing and persisting it only once per text."""
+    parsed = document.current_parse()
+    if parsed:
+        return deserialize_doc(parsed, document.lang)
+
+    embedded_text = embed_text(document.text, document.lang)
+    document.parsed = serialize_doc(embedded_text)
+    document.parsed_version = document.parse_version()
+    document.save(update_fields=["parsed", "parsed_version"])
+    return embedded_text
+
+
+def store_section_entities(sections, spans):
+    """
+    Stores the entity spans of each section (see embedding.sentence_entities).
+    Offsets are relative to the sentence the section was built from.
+    """
+    entities = [
+        SectionEntity(
+            section=section,
+            text=text[:255],
+            label=label,
+            start_char=start_char,
+            end_char=end_char,
+        )
+        for section in sections
+        if section.doc_index < len(spans)
+        for text, label, start_char, end_char in spans[section.doc_index]
+    ]
+    SectionEntity.objects.bulk_create(entities)
+
+
+def index_section_entities(document_id):
+    """
+    Stores the entity spans of a document ingested before they were stored,
+    from its parsed document.
+
+    Returns:
+        bool: Whether the document still had to be indexed.
+    """
+    with transaction.atomic():
+        # Concurrent runs would store the spans twice
+        document = Document.objects.select_for_update().get(id=document_id)
+        if document.entities_indexed:
+            return False
+        document_sections = list(document.section_set.all())
+        SectionEntity.objects.filter(section__in=document_sections).delete()
+        store_section_entities(
+            document_sections, sentence_entities(load_embedded_text(document))
+        )
+        document.entities_indexed = True
+        document.save(update_fields=["entities_indexed"])
+    return True
+
+
+def load_window_entities(hits, range_before, range_after):
+    """
+    Reads the stored entity spans of the hits and their context windows (see
+    context.fetch_context_windows) with one query, so that the room mapping
+    covers every sentence that is sent to the client.
+
+    No model runs here: documents ingested before entity spans were stored
+    have none until manage.py index_section_entities indexed them.
+
+    Args:
+        hits (Iterable[Tuple[int, int]]): (document_id, doc_index) of each hit.
+
+    Returns:
+        List[SectionEntity]: The entity spans in all windows.
+    """
+    hits = list(dict.fromkeys(hits))
+    if not hits:
+        return []
+
+    return list(
+        SectionEntity.objects.filter(
+            window_filter(hits, range_before, range_after, prefix="section__")
+        ).order_by("section__document_id", "section__doc_index", "start_char")
+    )
@@ -0,0 +1,67 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from .models import Section
+
+
+def window_filter(hits, range_before, range_after, prefix=""):
+    """
+    Matches the sections of the context windows around the hits, or with a
+    prefix (e.g. "section__") the rows related to them.
+    """
+    return reduce(
+        or_,
+        [
+            Q(
+                **{
+                    f"{prefix}document_id": document_id,
+                    f"{prefix}doc_index__range": (
+                        doc_index - range_before,
+                        doc_index + range_after,
+                    ),
+                }
+            )
+            for document_id, doc_index in hits
+        ],
+    )
+
+
+def fetch_context_windows(hits, range_before, range_after):
+    """
+    Loads the neighbouring sections of several search hits with one query.
+
+    Args:
+        hits (Iterable[Tuple[int, int]]): (document_id, doc_index) of each hit.
+        range_before (int): Number of sections to include before a hit.
+        range_after (int): Number of sections to include after a hit.
+
+    Returns:
+        Dict[Tuple[int, int], Tuple[str, str]]: The context before and after
+        each hit, keyed by (document_id, doc_index).
+    """
+    hits = list(dict.fromkeys(hits))
+    if not hits:
+        return {}
+
+    neighbours = {}
+    for document_id, doc_index, content in Section.objects.filter(
+        window_filter(hits, range_before, range_after)
+    ).values_list("document_id", "doc_index", "content"):
+        neighbours[(document_id, doc_index)] = content
+
+    contexts = {}
+    for document_id, doc_index in hits:
+        before = [
+            neighbours[(document_id, i)]
+            for i in range(doc_index - range_before, doc_index)
+            if (document_id, i) in neighbours
+        ]
+        after = [
+            neighbours[(document_id, i)]
+            for i in range(doc_index + 1, doc_index + 1 + range_after)
+            if (document_id, i) in neighbours
+        ]
+        contexts[(document_id, doc_index)] = (" ".join(before), " ".join(after))
+    return contexts
@@ -1,23 +1,47 @@
+import json
 import os
-import spacy
 import re
-from spacy.language import Language
-from spacy.tokens import Doc
-from sentence_transformers import SentenceTransformer
-import torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from typing import TYPE_CHECKING
 
+from . import offload
+from .inference_client import client as inference_client
+from .micro_batcher import MicroBatcher
+from .model_registry import ModelRegistry
 
-# Check if GPU is available
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
+# spaCy, torch and the transformer libraries are imported by the model
+# loaders, so that importing this module (e.g. from the views in manage.py
+# commands) does not cost seconds
 
-# Load spaCy models
-nlp_de = spacy.load("de_core_news_lg")
-nlp_en = spacy.load("en_core_web_lg")
+# Models are loaded on first use or by warm_up, and the least recently used
+# ones are unloaded when MODEL_MEMORY_BUDGET_MB would be exceeded
+registry = ModelRegistry(int(os.getenv("MODEL_MEMORY_BUDGET_MB", 0)))
+
+if TYPE_CHECKING:
+    from spacy.tokens import Doc
+
+
+def get_device():
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def inference_mode():
+    # No autograd bookkeeping, and no writes to the weights' pages, which
+    # keeps them shared between forked workers
+    import torch
+
+    return torch.inference_mode()
+
+
+def set_torch_threads(threads):
+    """Limits the intra-op threads of torch, e.g. to the cores per worker."""
+    import torch
+
+    torch.set_num_threads(threads)
 
 # Custom component to detect various text structures
-@Language.component("custom_segmenter")
-def custom_segmenter(doc: Doc) -> Doc:
+def custom_segmenter(doc: "Doc") -> "Doc":
     if doc.is_parsed:
         return doc  # Avoid modifying if the document is already parsed
 
@@ -52,52 +76,262 @@ def custom_segmenter(doc: Doc) -> Doc:
 
     return doc
 
-# Add the custom component before the parser
-nlp_en.add_pipe("custom_segmenter", before="parser")
-nlp_de.add_pipe("custom_segmenter", before="parser")
+def load_spacy_model(name):
+    import spacy
+    from spacy.language import Language
 
-# Initialize the transformer model
-transformer = SentenceTransformer(
-    os.getenv("TRANSFORMER_MODEL", "paraphrase-multilingual-mpnet-base-v2")
-)
+    if not Language.has_factory("custom_segmenter"):
+        Language.component("custom_segmenter", func=custom_segmenter)
+    nlp = spacy.load(name)
+    # Add the custom component before the parser
+    nlp.add_pipe("custom_segmenter", before="parser")
+    return nlp
 
-# Load the summarization model and tokenizer
-bart_tokenizer = AutoTokenizer.from_pretrained("facebook/bart-large-cnn")
-bart_model = AutoModelForSeq2SeqLM.from_pretrained("facebook/bart-large-cnn").to(device)
 
-def embed_text(text, lang):
-    if lang == "de":
-        return nlp_de(text)
-    elif lang == "en":
-        return nlp_en(text)
-    else:
+def load_transformer(model_name):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def load_summarizer():
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained("facebook/bart-large-cnn")
+    model = AutoModelForSeq2SeqLM.from_pretrained("facebook/bart-large-cnn").to(get_device())
+    return tokenizer, model
+
+
+spacy_models = {"de": "de_core_news_lg", "en": "en_core_web_lg"}
+for name in spacy_models.values():
+    registry.register(f"spacy:{name}", lambda name=name: load_spacy_model(name))
+registry.register("summarizer", load_summarizer)
+
+transformer_name = os.getenv("TRANSFORMER_MODEL", "paraphrase-multilingual-mpnet-base-v2")
+
+
+def get_nlp(lang):
+    if lang not in spacy_models:
         raise ValueError("No languagetag present!")
+    return registry.get(f"spacy:{spacy_models[lang]}")
+
+
+def get_transformer(model_name=None):
+    """Returns the default transformer model (TRANSFORMER_MODEL) or the named one."""
+    name = f"transformer:{model_name or transformer_name}"
+    if not registry.is_registered(name):
+        registry.register(name, lambda: load_transformer(model_name or transformer_name))
+    return registry.get(name)
+
+
+def warm_up(names=None):
+    """
+    Loads models ahead of their first request. Names are "de"/"en" for the
+    spaCy pipelines, "transformer" for the default transformer model and
+    "summarizer"; all of them by default.
+    """
+    for name in names or ["de", "en", "transformer", "summarizer"]:
+        if name in spacy_models:
+            get_nlp(name)
+        elif name == "transformer":
+            get_transformer()
+        else:
+            registry.get(name)
+
+
+# Read once per model, the configuration does not change while running
+__dimensions = {}
+
+
+def fingerprint(model_name=None):
+    """
+    Identifies the vectors of a transformer model, e.g. for cached vectors.
+    Change TRANSFORMER_MODEL_REVISION whenever the weights behind a name change.
+    """
+    model_name = model_name or transformer_name
+    revision = (
+        os.getenv("TRANSFORMER_MODEL_REVISION", "main")
+        if model_name == transformer_name
+        else "main"
+    )
+    return f"{model_name}@{revision}:{dimension(model_name)}"
+
+
+def dimension(model_name=None):
+    """
+    Returns the size of a transformer model's vectors. It is read from the
+    model's configuration files, so the weights are not loaded for it.
+    """
+    model_name = model_name or transformer_name
+    if model_name not in __dimensions:
+        size = __configured_dimension(model_name)
+        if size is None:
+            # Not a sentence-transformers model, only loading it tells
+            if inference_client is not None:
+                size = __remote("dimension", model_name)
+            else:
+                size = offload.run(__loaded_dimension, model_name)
+        __dimensions[model_name] = size
+    return __dimensions[model_name]
+
+
+def __configured_dimension(model_name):
+    # The last Dense layer sets the size, otherwise the pooling: the token
+    # embedding size times the number of pooling modes
+    size = None
+    for module in __model_file(model_name, "modules.json") or []:
+        if module["type"].endswith(".Dense"):
+            config = __model_file(model_name, f"{module['path']}/config.json")
+            size = config["out_features"]
+        elif module["type"].endswith(".Pooling"):
+            config = __model_file(model_name, f"{module['path']}/config.json")
+            modes = [key for key, value in config.items() if key.startswith("pooling_mode_") and value]
+            size = config["word_embedding_dimension"] * len(modes)
+    return size
+
+
+def __loaded_dimension(model_name):
+    return get_transformer(model_name).get_sentence_embedding_dimension()
+
+
+def __model_file(model_name, filename):
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, filename)
+        if not os.path.exists(path):
+            return None
+    else:
+        from huggingface_hub import hf_hub_download
+        from huggingface_hub.utils import EntryNotFoundError
+
+        # Like SentenceTransformer, short names refer to sentence-transformers/
+        repo_id = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+        try:
+            path = hf_hub_download(repo_id, filename)
+        except EntryNotFoundError:
+            # Also raised offline when the file is not cached; the caller
+            # falls back to loading the model
+            return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def __remote(method, *args):
+    # multiprocessing.connection reads and writes its file descriptor with
+    # os.read/os.write, which gevent does not make cooperative
+    return offload.run(inference_client.call, method, *args)
+
+
+def embed_text(text, lang):
+    if inference_client is not None:
+        return deserialize_doc(__remote("parse", text, lang), lang)
+    return offload.run(__parse, text, lang)
+
+
+def __parse(text, lang):
+    return get_nlp(lang)(text)
+
+def parsed_doc_attrs():
+    # Attributes kept when a parsed document is persisted: tokens, sentence
+    # boundaries and entity spans. Tags and dependency trees are not needed later.
+    from spacy.attrs import ENT_IOB, ENT_TYPE, ORTH, SENT_START, SPACY
+
+    return [ORTH, SPACY, SENT_START, ENT_IOB, ENT_TYPE]
+
+
+def serialize_doc(embedded_text):
+    from spacy.tokens import DocBin
+
+    doc_bin = DocBin(attrs=parsed_doc_attrs())
+    doc_bin.add(embedded_text)
+    return doc_bin.to_bytes()
+
+
+def deserialize_doc(data, lang):
+    from spacy.tokens import DocBin
+    from spacy.vocab import Vocab
+
+    # The DocBin carries its strings, so the pipeline's vocab (and loading
+    # the pipeline for it) is not needed
+    doc_bin = DocBin(attrs=parsed_doc_attrs()).from_bytes(bytes(data))
+    return next(doc_bin.get_docs(Vocab()))
+
+
+def sentence_entities(embedded_text):
+    """
+    Collects the entity spans of every sentence of a parsed document.
+
+    Returns:
+        List[List[Tuple[str, str, int, int]]]: Per sentence, the text, label and
+        sentence-relative start and end offsets of each entity.
+    """
+    return [
+        [
+            (
+                ent.text,
+                ent.label_,
+                ent.start_char - sent.start_char,
+                ent.end_char - sent.start_char,
+            )
+            for ent in sent.ents
+        ]
+        for sent in embedded_text.sents
+    ]
+
 
 def prepare_text(embedded_text):
     tokens = [[w.text for w in s] for s in embedded_text.sents]
     return tokens
 
-def return_context(embedded_text_, fact_index, range_before_, range_after_):
-    text_sents = list(embedded_text_.sents)
+def clean_join(tokens):
+    text = " ".join(tokens)
+    # Remove spaces before punctuation marks (commas, periods, etc.)
+    text = re.sub(r"\s([,.?!)])", r"\1", text)
+    text = re.sub(r"(\()\s", r"\1", text)
+    return text
 
-    context_before = ""
-    text_range_before = range(max(fact_index - range_before_, 0), fact_index)
+def vectorize(tokens, batch_size=32, model_name=None):
+    if inference_client is not None:
+        return __remote("vectorize", tokens, batch_size, model_name)
+    return offload.run(__encode, tokens, batch_size, model_name)
 
-    context_after = ""
-    text_range_after = range(
-        fact_index + 1, min(fact_index + 1 + range_after_, len(text_sents))
-    )
 
-    for i, sent in enumerate(text_sents):
-        if i in text_range_before:
-            context_before += sent.text
-        if i in text_range_after:
-            context_after += sent.text
+# Concurrent queries are encoded together, one batcher per transformer model
+__query_batch_size = int(os.getenv("QUERY_BATCH_MAX_SIZE", 32))
+__query_batch_wait = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", 5)) / 1000
+__query_batchers = {}
 
-    return (context_before, context_after)
 
-def vectorize(tokens):
-    return transformer.encode(tokens)
+def vectorize_query(text, model_name=None):
+    """
+    Returns the vector of a single search query. Queries arriving within
+    QUERY_BATCH_MAX_WAIT_MS of each other (up to QUERY_BATCH_MAX_SIZE) are
+    encoded in one batch.
+    """
+    if inference_client is not None:
+        # Batched across all web workers in the inference server
+        return __remote("vectorize_query", text, model_name)
+    if __query_batch_size <= 1:
+        return vectorize(text, model_name=model_name)
+
+    model_name = model_name or transformer_name
+    batcher = __query_batchers.get(model_name)
+    if batcher is None:
+        batcher = __query_batchers.setdefault(
+            model_name,
+            MicroBatcher(
+                "query",
+                lambda texts: vectorize(texts, batch_size=len(texts), model_name=model_name),
+                __query_batch_size,
+                __query_batch_wait,
+            ),
+        )
+    return batcher.submit(text)
+
+
+def __encode(tokens, batch_size, model_name):
+    transformer = get_transformer(model_name)
+    with inference_mode():
+        return transformer.encode(tokens, batch_size=batch_size)
 
 def is_first_alpha_uppercase(line):
     # This function will return True if the first alphabetic character is uppercase, ignoring numbers or symbols.
@@ -153,34 +387,26 @@ def summarize_text(text: str) -> str:
     Returns:
         str: The summarized text.
     """
+    if inference_client is not None:
+        return __remote("summarize", text)
+    return offload.run(__summarize, text)
+
+
+def __summarize(text):
+    bart_tokenizer, bart_model = registry.get("summarizer")
     # Ensure the input does not exceed the maximum length allowed by the model
     max_input_length = bart_tokenizer.model_max_length
-    inputs = bart_tokenizer([text], max_length=min(1024, max_input_length), truncation=True, return_tensors="pt").to(device)
+    inputs = bart_tokenizer([text], max_length=min(1024, max_input_length), truncation=True, return_tensors="pt").to(get_device())
 
     # Generate summary
     try:
-        summary_ids = bart_model.generate(inputs["input_ids"], num_beams=4, max_length=150, early_stopping=True)
+        with inference_mode():
+            summary_ids = bart_model.generate(inputs["input_ids"], num_beams=4, max_length=150, early_stopping=True)
         return bart_tokenizer.decode(summary_ids[0], skip_special_tokens=True)
     except IndexError as e:
         print(f"Error generating summary: {e}")
         return "An error occurred during summarization. Please check input length and formatting."
 
-def detect_entities(text, lang):
-    nlp = nlp_de if lang == "de" else nlp_en
-    doc = nlp(text)
-    return doc.ents
-
-def map_entities(entities, text, counter):
-    entity_mapping = {}
-    for entity in entities:
-        entity_label = entity.label_
-        original_value = entity.text
-        if original_value not in entity_mapping:
-            pseudo_value = generate_pseudo(entity_label, counter.get(entity_label, 0))
-            counter[entity_label] = counter.get(entity_label, 1) + 1
-            entity_mapping[original_value] = pseudo_value
-    return entity_mapping
-
 def generate_pseudo(entity_type, counter):
     return f"{entity_type}_{counter+1}"
 
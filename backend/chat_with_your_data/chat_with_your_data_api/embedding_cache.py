@@ -0,0 +1,130 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Disk-backed cache of sentence vectors, keyed by the hash of the normalized
+    sentence and the fingerprint of the model that computed the vector.
+
+    The least recently used entries are evicted once the cache holds more than
+    max_entries vectors. Hits and misses are counted per process and in total.
+    """
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__connection = None
+
+    def __connect(self):
+        if self.__connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self.__connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self.__connection.execute("PRAGMA journal_mode=WAL")
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self.__connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self.__connection.execute(
+                "INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0)"
+            )
+            self.__connection.commit()
+        return self.__connection
+
+    @staticmethod
+    def key(text, fingerprint):
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{fingerprint}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Returns the cached vectors of the given keys as a dict."""
+        found = {}
+        with self.__lock:
+            connection = self.__connect()
+            unique_keys = list(dict.fromkeys(keys))
+            for offset in range(0, len(unique_keys), 500):
+                batch = unique_keys[offset : offset + 500]
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+                connection.execute(
+                    f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(batch))})",
+                    [time.time(), *batch],
+                )
+
+            hits = sum(1 for key in keys if key in found)
+            self.hits += hits
+            self.misses += len(keys) - hits
+            connection.execute(
+                "UPDATE stats SET value = value + ? WHERE name = 'hits'", (hits,)
+            )
+            connection.execute(
+                "UPDATE stats SET value = value + ? WHERE name = 'misses'",
+                (len(keys) - hits,),
+            )
+            connection.commit()
+        return found
+
+    def put_many(self, items):
+        """Stores (key, vector) pairs and evicts the least recently used entries."""
+        now = time.time()
+        with self.__lock:
+            connection = self.__connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for key, vector in items
+                ],
+            )
+            (count,) = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if count > self.max_entries:
+                connection.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            connection.commit()
+
+    def stats(self):
+        """Returns the entry count and the total hits and misses of all processes."""
+        with self.__lock:
+            connection = self.__connect()
+            (entries,) = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            totals = dict(connection.execute("SELECT name, value FROM stats").fetchall())
+        return {"entries": entries, "max_entries": self.max_entries, **totals}
+
+    def clear(self):
+        with self.__lock:
+            connection = self.__connect()
+            connection.execute("DELETE FROM embeddings")
+            connection.execute("UPDATE stats SET value = 0")
+            connection.commit()
+
+
+__cache_path = os.getenv("EMBEDDING_CACHE_PATH", "../cache/embeddings.sqlite3")
+__cache_max_entries = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 1000000))
+
+# An empty EMBEDDING_CACHE_PATH disables the cache
+cache = EmbeddingCache(__cache_path, __cache_max_entries) if __cache_path else None
@@ -1,20 +1,27 @@
+import hashlib
+import multiprocessing
 import os
 import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-import ocrmypdf
 import pypdf
-import textract
 from bs4 import BeautifulSoup
 from docx import Document
 from striprtf.striprtf import rtf_to_text
 
+__ocr_workers = int(os.getenv("OCR_WORKERS", 2))
+
 
 def save_file(folder_path, file):
+    """Saves an uploaded file and returns its path and SHA-256 content hash."""
     temp_file_path = os.path.join(folder_path, file.name)
+    content_hash = hashlib.sha256()
     with open(temp_file_path, "wb+") as destination:
         for chunk in file.chunks():
+            content_hash.update(chunk)
             destination.write(chunk)
-    return temp_file_path
+    return temp_file_path, content_hash.hexdigest()
 
 
 def extract_text(file_path, file_name):
@@ -22,9 +29,7 @@ def extract_text(file_path, file_name):
 
     match file_ext:
         case ".pdf":
-            if __is_scanned_pdf(file_path):
-                return __extract_text_from_scanned_pdf(file_path)
-            return textract.process(file_path, method="pdfminer").decode("utf-8")
+            return "\n".join(iter_pdf_pages(file_path))
 
         case ".docx":
             doc = Document(file_path)
@@ -43,24 +48,68 @@ def extract_text(file_path, file_name):
             return __simple_extract(file_path)
 
 
-def __is_scanned_pdf(file_path):
-    with open(file_path, "rb") as file:
-        reader = pypdf.PdfReader(file)
-        for page in reader.pages:
+def iter_pdf_pages(file_path):
+    """
+    Yields the text of a PDF page by page, in page order.
+
+    Pages with a text layer are read with pypdf, only pages without text are
+    OCRed, in parallel in a pool of OCR_WORKERS processes.
+    """
+    reader = pypdf.PdfReader(file_path)
+    executor = None
+    pages = deque()
+
+    try:
+        for page_number, page in enumerate(reader.pages):
             text = page.extract_text()
-            if text:
-                # Es wurde Text auf der Seite gefunden
-                return False
-    return True
-
-
-def __extract_text_from_scanned_pdf(file_path):
-    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
-        temp_pdf_path = temp_file.name
-        ocrmypdf.ocr(file_path, temp_pdf_path)
-        text = textract.process(temp_pdf_path, method="pdfminer").decode("utf-8")
-        os.unlink(temp_pdf_path)
-        return text
+            if text and text.strip():
+                pages.append(text)
+            else:
+                if executor is None:
+                    executor = ProcessPoolExecutor(
+                        max_workers=__ocr_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                pages.append(executor.submit(__ocr_page, file_path, page_number))
+
+            # Hand out the leading pages that are ready while later pages are read
+            while pages and (isinstance(pages[0], str) or pages[0].done()):
+                yield __page_text(pages.popleft())
+
+        while pages:
+            yield __page_text(pages.popleft())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def __page_text(page):
+    return page if isinstance(page, str) else page.result()
+
+
+def __ocr_page(file_path, page_number):
+    # Imported in the OCR workers only, it is slow to import
+    import ocrmypdf
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        page_path = os.path.join(temp_dir, "page.pdf")
+        writer = pypdf.PdfWriter()
+        writer.add_page(pypdf.PdfReader(file_path).pages[page_number])
+        with open(page_path, "wb") as page_file:
+            writer.write(page_file)
+
+        text_path = os.path.join(temp_dir, "page.txt")
+        ocrmypdf.ocr(
+            page_path,
+            os.path.join(temp_dir, "page_ocr.pdf"),
+            sidecar=text_path,
+            jobs=1,
+            progress_bar=False,
+            # Pages with a little text (e.g. a page number) would fail with PriorOcrFoundError
+            force_ocr=True,
+        )
+        with open(text_path, "r", encoding="utf-8") as text_file:
+            return text_file.read()
 
 
 def __simple_extract(file_path):
@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+from multiprocessing.connection import Client
+
+
+class InferenceClient:
+    """
+    Thin client of the inference server (manage.py inference_server), which
+    owns the models for all processes on the host.
+
+    Every thread keeps its own connection, since a connection carries one
+    request at a time. The connection blocks its thread even under gevent, so
+    embedding.py calls it through offload.run. Exceptions raised by the server
+    are raised again here.
+    """
+
+    def __init__(self, path, authkey, connect_timeout=60.0):
+        self.path = path
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self.__local = threading.local()
+
+    def call(self, method, *args, **kwargs):
+        for attempt in range(2):
+            connection = self.__connection()
+            try:
+                connection.send((method, args, kwargs))
+                status, result = connection.recv()
+                break
+            except (EOFError, OSError):
+                # The server restarted; reconnect once
+                self.__local.connection = None
+                if attempt:
+                    raise
+        if status == "error":
+            raise result
+        return result
+
+    def __connection(self):
+        connection = getattr(self.__local, "connection", None)
+        if connection is None:
+            connection = self.__connect()
+            self.__local.connection = connection
+        return connection
+
+    def __connect(self):
+        # The server may still be loading its models when the web workers start
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                return Client(self.path, family="AF_UNIX", authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.5)
+
+
+def authkey():
+    # Without a key any local process able to open the socket could send
+    # pickles to the server, which unpickles them
+    key = os.getenv("INFERENCE_AUTHKEY", "")
+    if not key:
+        raise RuntimeError("INFERENCE_AUTHKEY must be set to use the inference server")
+    return key.encode("utf-8")
+
+
+__socket_path = os.getenv("INFERENCE_SOCKET", "")
+client = (
+    InferenceClient(
+        __socket_path,
+        authkey(),
+        float(os.getenv("INFERENCE_CONNECT_TIMEOUT", 60)),
+    )
+    if __socket_path
+    else None
+)
@@ -0,0 +1,82 @@
+import os
+import threading
+from multiprocessing.connection import Listener
+
+from . import embedding
+from .inference_client import authkey
+
+
+def __vectorize(tokens, batch_size=32, model_name=None):
+    return embedding.vectorize(tokens, batch_size, model_name)
+
+
+def __vectorize_query(text, model_name=None):
+    return embedding.vectorize_query(text, model_name)
+
+
+def __dimension(model_name=None):
+    return embedding.get_transformer(model_name).get_sentence_embedding_dimension()
+
+
+def __parse(text, lang):
+    return embedding.serialize_doc(embedding.embed_text(text, lang))
+
+
+def __summarize(text):
+    return embedding.summarize_text(text)
+
+
+METHODS = {
+    "vectorize": __vectorize,
+    "vectorize_query": __vectorize_query,
+    "dimension": __dimension,
+    "parse": __parse,
+    "summarize": __summarize,
+}
+
+
+def serve(path, warm_up=True):
+    """
+    Serves the model calls of METHODS to InferenceClient connections on a
+    Unix socket, one thread per connection. The models are loaded once here
+    instead of in every web and ingestion worker.
+    """
+    # INFERENCE_SOCKET is set for the whole deployment; the server itself
+    # runs the models instead of calling itself
+    embedding.inference_client = None
+    # Fails before the slow warm up when no key is set
+    key = authkey()
+    if warm_up:
+        embedding.warm_up()
+    if os.path.exists(path):
+        os.remove(path)
+
+    with Listener(path, family="AF_UNIX", authkey=key) as listener:
+        print(f"Inference server listening on {path}")
+        while True:
+            try:
+                connection = listener.accept()
+            except Exception as e:
+                # E.g. a client with the wrong authkey
+                print(f"Rejected inference connection: {e}")
+                continue
+            threading.Thread(target=__handle, args=(connection,), daemon=True).start()
+
+
+def __handle(connection):
+    with connection:
+        while True:
+            try:
+                method, args, kwargs = connection.recv()
+            except (EOFError, OSError):
+                return
+
+            try:
+                result = ("ok", METHODS[method](*args, **kwargs))
+            except Exception as e:
+                result = ("error", e)
+            try:
+                connection.send(result)
+            except Exception as e:
+                # Results and exceptions that cannot be pickled
+                connection.send(("error", RuntimeError(f"{method} failed: {e}")))
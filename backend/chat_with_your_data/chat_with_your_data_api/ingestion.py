@@ -0,0 +1,265 @@
+import os
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .file_importer import save_file
+from .models import Document, IngestionJob, Section, SectionEntity
+from .pipeline import analyze_file, submit
+from .qdrant import (copy_document, delete_text, index_version, insert_text,
+                     tenant_model)
+
+INGEST_TEMP_PATH = "../temp/ingest"
+# Seconds between the heartbeats of a running job
+HEARTBEAT_INTERVAL = 30
+
+
+def enqueue_upload(user, files):
+    """
+    Saves the uploaded files and queues one ingestion job for them.
+
+    The documents are created right away in the "processing" state; a worker
+    (manage.py process_ingestion_jobs) extracts, parses and embeds them.
+
+    Returns:
+        Tuple[IngestionJob, List[Document]]: The queued job and its documents.
+    """
+    documents = []
+    job_files = []
+    with transaction.atomic():
+        for file in files:
+            # A folder per file, files of one upload may share a name
+            folder_path = os.path.join(INGEST_TEMP_PATH, str(uuid.uuid4()))
+            Path(folder_path).mkdir(parents=True, exist_ok=True)
+            temp_file_path, content_hash = save_file(folder_path, file)
+            document = Document.objects.create(
+                filename=file.name,
+                text="",
+                user=user,
+                lang=user.lang,
+                fileSize=file.size,
+                status="processing",
+                content_hash=content_hash,
+            )
+            documents.append(document)
+            job_files.append(
+                {"document": document.id, "path": temp_file_path, "filename": file.name}
+            )
+
+        job = IngestionJob.objects.create(user=user, files=job_files)
+    return job, documents
+
+
+def claim_job():
+    """Marks the oldest queued job as processing and returns it, or None."""
+    with transaction.atomic():
+        job = (
+            IngestionJob.objects.select_for_update(skip_locked=True)
+            .filter(status="queued")
+            .order_by("created_at")
+            .first()
+        )
+        if job is None:
+            return None
+        job.status = "processing"
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(update_fields=["status", "started_at", "heartbeat_at"])
+    return job
+
+
+def requeue_stale_jobs(seconds):
+    """
+    Puts jobs back into the queue whose worker died while processing them,
+    i.e. sent no heartbeat for the given number of seconds.
+    """
+    beat_before = timezone.now() - timedelta(seconds=seconds)
+    return (
+        IngestionJob.objects.filter(status="processing")
+        .filter(Q(heartbeat_at__lt=beat_before) | Q(heartbeat_at__isnull=True))
+        .update(status="queued")
+    )
+
+
+@contextmanager
+def heartbeat(job):
+    """Marks the job as alive every HEARTBEAT_INTERVAL seconds while it runs."""
+    stopped = threading.Event()
+
+    def beat():
+        try:
+            while not stopped.wait(HEARTBEAT_INTERVAL):
+                IngestionJob.objects.filter(id=job.id, status="processing").update(
+                    heartbeat_at=timezone.now()
+                )
+        except Exception:
+            traceback.print_exc()
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def run_job(job):
+    """
+    Ingests all documents of a job. Like the synchronous upload, a job is all
+    or nothing: if one document fails, all documents of the job are removed.
+    """
+    [_, id] = job.user.auth0_id.split("|")
+    documents = Document.objects.in_bulk([file["document"] for file in job.files])
+    model_name = tenant_model(id)
+    start = time.perf_counter()
+    analyses = []
+
+    try:
+        # Files already ingested with identical content reuse those results,
+        # the others are extracted, parsed and embedded in parallel in the
+        # process pool; the results are stored here in upload order
+        sources = {
+            file["document"]: find_duplicate(documents[file["document"]], model_name)
+            for file in job.files
+        }
+        analyses = [
+            None
+            if sources[file["document"]] is not None
+            else submit(
+                analyze_file,
+                file["path"],
+                file["filename"],
+                documents[file["document"]].lang,
+                model_name,
+            )
+            for file in job.files
+        ]
+        for file, analysis in zip(job.files, analyses):
+            document = documents[file["document"]]
+            timings = {}
+            job.timings[str(document.id)] = timings
+
+            # A requeued job may have ingested parts of the document already
+            Section.objects.filter(document=document).delete()
+            delete_text(id, document)
+
+            source = sources[document.id]
+            if source is not None:
+                copy_ingested_document(source, document, id, timings, model_name)
+                continue
+
+            analysis = analysis.result()
+            document.text = analysis["text"]
+            document.save(update_fields=["text"])
+            insert_text(id, document, document.lang, timings, analysis)
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        traceback.print_exc()
+        for analysis in analyses:
+            if analysis is not None:
+                analysis.cancel()
+        # Each step on its own: when Qdrant caused the failure, removing the
+        # points fails too, but the documents must still go
+        for document in documents.values():
+            try:
+                delete_text(id, document)
+            except Exception:
+                traceback.print_exc()
+            try:
+                document.delete()
+            except Exception:
+                traceback.print_exc()
+    else:
+        Document.objects.filter(id__in=documents.keys()).update(status="ready")
+        job.status = "done"
+    finally:
+        job.timings["total"] = time.perf_counter() - start
+        job.finished_at = timezone.now()
+        job.save(update_fields=["status", "error", "timings", "finished_at"])
+        __remove_job_files(job)
+
+
+def find_duplicate(document, model_name=None):
+    """
+    Returns an ingested document with the same content and language whose
+    vectors were computed with the given transformer model, if any.
+    """
+    if not document.content_hash:
+        return None
+    candidates = (
+        Document.objects.select_related("user")
+        .filter(
+            content_hash=document.content_hash,
+            lang=document.lang,
+            status="ready",
+            entities_indexed=True,
+        )
+        .exclude(id=document.id)
+    )
+    for candidate in candidates:
+        if candidate.index_version == index_version(candidate, model_name):
+            return candidate
+    return None
+
+
+def copy_ingested_document(source, document, collection_name, timings, model_name=None):
+    """
+    Gives the document the text, sections, entity spans and vectors of an
+    already ingested document with identical content, without extracting,
+    parsing or embedding it again. The source's vectors must have been
+    computed with the given transformer model (see find_duplicate).
+    """
+    start = time.perf_counter()
+    document.text = source.text
+    document.parsed = source.parsed
+    document.parsed_version = source.parsed_version
+    document.entities_indexed = True
+    document.save(update_fields=["text", "parsed", "parsed_version", "entities_indexed"])
+
+    source_sections = list(Section.objects.filter(document=source).order_by("doc_index"))
+    sections = Section.objects.bulk_create(
+        [
+            Section(document=document, content=section.content, doc_index=section.doc_index)
+            for section in source_sections
+        ]
+    )
+    section_map = {
+        source_section.id: section
+        for source_section, section in zip(source_sections, sections)
+    }
+    SectionEntity.objects.bulk_create(
+        [
+            SectionEntity(
+                section=section_map[entity.section_id],
+                text=entity.text,
+                label=entity.label,
+                start_char=entity.start_char,
+                end_char=entity.end_char,
+            )
+            for entity in SectionEntity.objects.filter(section__document=source)
+        ]
+    )
+
+    [_, source_collection] = source.user.auth0_id.split("|")
+    copy_document(
+        source_collection, source, collection_name, document, section_map, model_name
+    )
+    timings["copy"] = time.perf_counter() - start
+
+
+def __remove_job_files(job):
+    folders = {os.path.dirname(file["path"]) for file in job.files}
+    for folder in folders:
+        shutil.rmtree(folder, ignore_errors=True)
@@ -1,26 +1,42 @@
 import os
+from functools import lru_cache
 
-import tiktoken
-from langchain.chains import LLMChain
-from langchain.llms import OpenAI
-from langchain.prompts import PromptTemplate
+# tiktoken and LangChain are imported on first use, so that importing this
+# module (e.g. from models.py in manage.py migrate) stays cheap
 
 token_encoder = "cl100k_base"  # used for ChatGPT 3.5 Turbo and ChatGPT 4
-llm = OpenAI(openai_api_key=os.getenv("OPEN_AI_KEY"))
+
+
+@lru_cache(maxsize=None)
+def get_encoder():
+    import tiktoken
+
+    return tiktoken.get_encoding(token_encoder)
+
+
+@lru_cache(maxsize=None)
+def get_llm():
+    from langchain.llms import OpenAI
+
+    return OpenAI(openai_api_key=os.getenv("OPEN_AI_KEY"))
 
 
 def count_tokens(template, question, context):
+    from langchain.prompts import PromptTemplate
+
     prompt_template = PromptTemplate(
         template=template, input_variables=["context", "question"]
     )
     prompt = prompt_template.format(question=question, context=context)
-    encoder = tiktoken.get_encoding(token_encoder)
-    return len(encoder.encode(prompt))
+    return len(get_encoder().encode(prompt))
 
 
 def run_llm(template, prompt):
+    from langchain.chains import LLMChain
+    from langchain.prompts import PromptTemplate
+
     prompt_template = PromptTemplate(
         template=template, input_variables=["context", "question"]
     )
-    llm_chain = LLMChain(prompt=prompt_template, llm=llm)
+    llm_chain = LLMChain(prompt=prompt_template, llm=get_llm())
     return llm_chain.run(prompt)
@@ -1,14 +1,7 @@
-# Import the openai package
-import os
 from pprint import pprint
 
-import openai
-
 from .models import ContextEntry, Room, RoomSettings, User
 
-# Set openai.api_key to the OPENAI environment variable
-openai.api_key = os.getenv("OPEN_AI_KEY")
-
 
 class ContextEntry:
     """represents one context line in the form:
@@ -51,7 +44,6 @@ class Room_:
 class LLM:
     def __init__(self, apiKey):
         self.apiKey = apiKey
-        openai.api_key = self.apiKey
 
     def run(self, room: Room, question: str, model: str, is_demo: bool = False):
         """
@@ -70,6 +62,10 @@ class LLM:
 
         room.appendContext(room, "user", question, is_demo)
 
+        # Imported here to keep the import of the views cheap
+        import openai
+
+        openai.api_key = self.apiKey
         response = openai.ChatCompletion.create(
             model=model,
             messages=room.createFullMessage(room, False, is_demo, question),
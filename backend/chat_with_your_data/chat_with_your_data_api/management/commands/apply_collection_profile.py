@@ -0,0 +1,27 @@
+from chat_with_your_data_api.models import User
+from chat_with_your_data_api.qdrant import apply_collection_profile
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Re-applies a collection profile (HNSW, quantization, on-disk storage) to the existing user collections"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--profile",
+            choices=["default", "compact", "binary"],
+            help="Profile to apply, defaults to QDRANT_COLLECTION_PROFILE",
+        )
+
+    def handle(self, *args, **options):
+        for user in User.objects.all():
+            [_, id] = user.auth0_id.split("|")
+            try:
+                apply_collection_profile(id, options["profile"])
+            except Exception as e:
+                self.stdout.write(
+                    self.style.WARNING(f"Skipped collection {id}: {e}")
+                )
+                continue
+
+            self.stdout.write(self.style.SUCCESS(f"Updated collection: {id}"))
@@ -0,0 +1,27 @@
+from chat_with_your_data_api.models import User
+from chat_with_your_data_api.qdrant import convert_legacy_collection, is_shared
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves collections created before aliases were used behind an alias, "
+        "which migrate_embedding_model needs to switch them without downtime"
+    )
+
+    def handle(self, *args, **options):
+        if is_shared():
+            # The name is ignored in shared mode, all users share one collection
+            names = ["shared"]
+        else:
+            names = [user.auth0_id.split("|")[1] for user in User.objects.all()]
+
+        for name in names:
+            try:
+                converted = convert_legacy_collection(name)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"Skipped collection {name}: {e}"))
+                continue
+
+            if converted:
+                self.stdout.write(self.style.SUCCESS(f"Converted collection: {name}"))
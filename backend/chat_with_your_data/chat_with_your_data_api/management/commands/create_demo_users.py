@@ -1,7 +1,7 @@
 import os
 
-from chat_with_your_data_api.file_importer import extract_text
 from chat_with_your_data_api.models import Document, Room, RoomDocuments, User
+from chat_with_your_data_api.pipeline import analyze_file, submit
 from chat_with_your_data_api.qdrant import create_collection, insert_text
 from chat_with_your_data_api.room_settings import RoomSettings
 from chat_with_your_data_api.serializers import DocumentSerializer
@@ -16,40 +16,45 @@ class Command(BaseCommand):
         root_path = os.path.join("./ExampleFiles", user.lang)
         added_files = []
         document_objects = []
+        analyses = []
 
+        # Extract, parse and embed the new files in parallel in the process pool
         for dirpath, dirnames, filenames in os.walk(root_path):
             for file_name in filenames:
                 file_path = os.path.join(dirpath, file_name)
-                file_size = os.path.getsize(file_path)
-
-                text = extract_text(file_path, file_name)
 
                 existing_document = Document.objects.filter(
                     filename=file_name, user=user
                 ).first()
 
                 if existing_document is None:
-                    document = {
-                        "filename": file_name,
-                        "text": text,
-                        "user": user.id,
-                        "lang": user.lang,
-                        "fileSize": file_size,
-                    }
-
-                    serializer = DocumentSerializer(data=document)
-                    if serializer.is_valid():
-                        result = serializer.save()
-                        document_objects.append(result)
-                        [_, id] = user.auth0_id.split("|")
-                        insert_text(id, result, user.lang)
-                        added_files.append(file_name)
-                        self.stdout.write(
-                            self.style.SUCCESS(f"Added file: {file_name}")
-                        )
+                    analyses.append(
+                        (file_path, file_name, submit(analyze_file, file_path, file_name, user.lang))
+                    )
                 else:
                     self.stdout.write(f"Skipped file: {file_name}")
 
+        for file_path, file_name, analysis in analyses:
+            analysis = analysis.result()
+            document = {
+                "filename": file_name,
+                "text": analysis["text"],
+                "user": user.id,
+                "lang": user.lang,
+                "fileSize": os.path.getsize(file_path),
+            }
+
+            serializer = DocumentSerializer(data=document)
+            if serializer.is_valid():
+                result = serializer.save()
+                document_objects.append(result)
+                [_, id] = user.auth0_id.split("|")
+                insert_text(id, result, user.lang, analysis=analysis)
+                added_files.append(file_name)
+                self.stdout.write(
+                    self.style.SUCCESS(f"Added file: {file_name}")
+                )
+
         return document_objects
 
     def create_room_with_documents(self, user, document_objects):
@@ -0,0 +1,20 @@
+from chat_with_your_data_api.models import User
+from chat_with_your_data_api.qdrant import create_payload_index
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Adds the document_id payload index to the existing user collections"
+
+    def handle(self, *args, **kwargs):
+        for user in User.objects.all():
+            [_, id] = user.auth0_id.split("|")
+            try:
+                create_payload_index(id)
+            except Exception as e:
+                self.stdout.write(
+                    self.style.WARNING(f"Skipped collection {id}: {e}")
+                )
+                continue
+
+            self.stdout.write(self.style.SUCCESS(f"Indexed collection: {id}"))
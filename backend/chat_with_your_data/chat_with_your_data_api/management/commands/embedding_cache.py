@@ -0,0 +1,29 @@
+from chat_with_your_data_api.embedding_cache import cache
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Shows the hit/miss counters of the embedding cache or clears it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--clear", action="store_true", help="Remove all cached vectors"
+        )
+
+    def handle(self, *args, **options):
+        if cache is None:
+            self.stdout.write(self.style.WARNING("The embedding cache is disabled."))
+            return
+
+        if options["clear"]:
+            cache.clear()
+            self.stdout.write(self.style.SUCCESS("Cleared the embedding cache."))
+            return
+
+        stats = cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups if lookups else 0
+        self.stdout.write(
+            f"{stats['entries']}/{stats['max_entries']} vectors cached, "
+            f"{stats['hits']} hits, {stats['misses']} misses ({hit_rate:.1%} hit rate)"
+        )
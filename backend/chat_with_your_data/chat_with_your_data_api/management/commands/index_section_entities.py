@@ -0,0 +1,23 @@
+from chat_with_your_data_api.anonymization import index_section_entities
+from chat_with_your_data_api.models import Document
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Stores the entity spans of documents ingested before they were stored, "
+        "which searches need to anonymize their context windows"
+    )
+
+    def handle(self, *args, **options):
+        document_ids = Document.objects.filter(
+            entities_indexed=False, status="ready"
+        ).order_by("id").values_list("id", flat=True)
+
+        indexed = 0
+        for document_id in list(document_ids):
+            try:
+                indexed += index_section_entities(document_id)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"Skipped document {document_id}: {e}"))
+        self.stdout.write(self.style.SUCCESS(f"Indexed the entities of {indexed} documents"))
@@ -0,0 +1,23 @@
+import os
+
+from chat_with_your_data_api.inference_server import serve
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Serves the models to the web and ingestion workers over a Unix socket"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--socket",
+            default=os.getenv("INFERENCE_SOCKET") or "/tmp/inference.sock",
+            help="Socket path, defaults to INFERENCE_SOCKET",
+        )
+        parser.add_argument(
+            "--no-warm-up",
+            action="store_true",
+            help="Load the models on first use instead of before listening",
+        )
+
+    def handle(self, *args, **options):
+        serve(options["socket"], warm_up=not options["no_warm_up"])
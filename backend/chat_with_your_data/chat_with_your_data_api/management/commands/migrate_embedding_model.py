@@ -0,0 +1,94 @@
+import time
+
+from chat_with_your_data_api.models import Document, Section, User
+from chat_with_your_data_api.qdrant import (index_version, is_shared,
+                                            start_model_migration,
+                                            switch_model_migration,
+                                            tenant_model, write_shadow_points)
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embeds the collections with another transformer model in the "
+        "background and switches them over once complete"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", required=True, help="SentenceTransformer model name")
+        parser.add_argument(
+            "--users",
+            nargs="*",
+            help="auth0 ids of the users to migrate, defaults to all (ignored in shared mode)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Documents embedded between two progress checkpoints",
+        )
+        parser.add_argument(
+            "--throttle",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep after each batch to leave capacity for live traffic",
+        )
+        parser.add_argument(
+            "--keep-old",
+            action="store_true",
+            help="Keep the previous collection after the switch for a rollback",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options["users"]:
+            users = users.filter(auth0_id__in=options["users"])
+
+        if is_shared():
+            # All users share one collection, which is migrated as a whole
+            self.migrate("shared", Document.objects.all(), options)
+            return
+
+        for user in users:
+            [_, id] = user.auth0_id.split("|")
+            try:
+                self.migrate(id, Document.objects.filter(user=user), options)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"Skipped collection {id}: {e}"))
+
+    def migrate(self, id, documents, options):
+        if tenant_model(id) == options["model"]:
+            self.stdout.write(f"Collection {id} already uses {options['model']}")
+            return
+
+        migration = start_model_migration(id, options["model"])
+        documents = documents.filter(status="ready").select_related("user").order_by("id")
+        total = documents.filter(id__gt=migration.last_document_id).count()
+        done = 0
+        start = time.perf_counter()
+        while True:
+            batch = list(documents.filter(id__gt=migration.last_document_id)[: options["batch_size"]])
+            if not batch:
+                break
+            for document in batch:
+                sections = list(Section.objects.filter(document=document).order_by("doc_index"))
+                write_shadow_points(migration, document, sections)
+            migration.last_document_id = batch[-1].id
+            migration.save(update_fields=["last_document_id"])
+            done += len(batch)
+            self.stdout.write(
+                f"Collection {id}: {done}/{total} documents "
+                f"({done / max(time.perf_counter() - start, 1e-9):.1f} documents/s)"
+            )
+            time.sleep(options["throttle"])
+
+        switch_model_migration(migration, options["keep_old"])
+
+        # Otherwise files/reload would embed every document again
+        migrated = list(documents)
+        for document in migrated:
+            document.index_version = index_version(document, options["model"])
+        Document.objects.bulk_update(migrated, ["index_version"], batch_size=500)
+        self.stdout.write(
+            self.style.SUCCESS(f"Switched collection {id} to {options['model']}")
+        )
@@ -0,0 +1,33 @@
+from chat_with_your_data_api.models import User
+from chat_with_your_data_api.qdrant import move_to_shared_collection
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Moves the per-user collections into the shared multi-tenant collection"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete-source",
+            action="store_true",
+            help="Delete each per-user collection after it was copied",
+        )
+
+    def handle(self, *args, **options):
+        for user in User.objects.all():
+            [_, id] = user.auth0_id.split("|")
+            try:
+                copied = move_to_shared_collection(id, options["delete_source"])
+            except Exception as e:
+                self.stdout.write(
+                    self.style.WARNING(f"Skipped collection {id}: {e}")
+                )
+                continue
+
+            self.stdout.write(
+                self.style.SUCCESS(f"Moved collection {id}: {copied} points")
+            )
+
+        self.stdout.write(
+            "Set QDRANT_STORAGE_MODE=shared to serve the users from the shared collection."
+        )
@@ -0,0 +1,81 @@
+import threading
+import time
+import traceback
+
+from chat_with_your_data_api.ingestion import (claim_job, heartbeat,
+                                               requeue_stale_jobs, run_job)
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+
+class Command(BaseCommand):
+    help = "Processes queued document ingestion jobs with a pool of local workers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0, help="Seconds between polls when idle"
+        )
+        parser.add_argument(
+            "--stale-seconds",
+            type=int,
+            default=120,
+            help="Requeue processing jobs whose worker sent no heartbeat for this long",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit once the queue is empty"
+        )
+
+    def work(self, poll_interval, stale_seconds, once):
+        last_requeue = 0
+        while True:
+            close_old_connections()
+            try:
+                # Also while running, jobs of other processes may die
+                if time.monotonic() - last_requeue >= stale_seconds:
+                    self.requeue(stale_seconds)
+                    last_requeue = time.monotonic()
+                job = claim_job()
+            except Exception:
+                traceback.print_exc()
+                time.sleep(poll_interval)
+                continue
+            if job is None:
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            try:
+                with heartbeat(job):
+                    run_job(job)
+            except Exception:
+                # The worker thread has to survive, e.g. a database outage;
+                # the job is requeued once its heartbeats are missing
+                traceback.print_exc()
+                continue
+            self.stdout.write(
+                f"Job {job.id} {job.status} in {job.timings['total']:.2f}s"
+            )
+
+    def requeue(self, stale_seconds):
+        requeued = requeue_stale_jobs(stale_seconds)
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale jobs"))
+
+    def handle(self, *args, **options):
+        workers = [
+            threading.Thread(
+                target=self.work,
+                args=(options["poll_interval"], options["stale_seconds"], options["once"]),
+                daemon=True,
+            )
+            for _ in range(options["workers"])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(
+            self.style.SUCCESS(f"Started {len(workers)} ingestion workers")
+        )
+        for worker in workers:
+            worker.join()
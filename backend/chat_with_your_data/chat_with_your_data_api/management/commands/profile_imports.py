@@ -0,0 +1,67 @@
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand
+
+# Packages that cost seconds to import and must only be imported on first use
+HEAVY_PACKAGES = [
+    "spacy",
+    "torch",
+    "transformers",
+    "sentence_transformers",
+    "langchain",
+    "tiktoken",
+    "openai",
+    "ocrmypdf",
+]
+
+
+class Command(BaseCommand):
+    help = "Profiles the import time of the app as management commands load it"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20, help="Slowest modules to show")
+        parser.add_argument(
+            "--budget", type=float, default=1.0, help="Seconds the imports may take"
+        )
+
+    def handle(self, *args, **options):
+        # A fresh interpreter, since this one has imported everything already
+        code = (
+            "import django; django.setup(); "
+            "import chat_with_your_data.urls"
+        )
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            self.stderr.write(result.stderr)
+            return
+
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "cumulative" in line:
+                continue
+            [_, cumulative, name] = line[len("import time:"):].split("|")
+            # Nested imports are indented by two spaces per level
+            modules.append((int(cumulative) / 1e6, name[1:].rstrip()))
+
+        # The sum of the top-level imports is the total
+        total = sum(seconds for seconds, name in modules if not name.startswith(" "))
+        for seconds, name in sorted(modules, reverse=True)[: options["top"]]:
+            self.stdout.write(f"{seconds:8.3f}s {name}")
+
+        imported = {name.strip().split(".")[0] for _, name in modules}
+        heavy = [package for package in HEAVY_PACKAGES if package in imported]
+        if heavy:
+            self.stdout.write(
+                self.style.WARNING(f"Imported at startup: {', '.join(heavy)}")
+            )
+
+        message = f"Total import time {total:.2f}s (budget {options['budget']:.2f}s)"
+        if total > options["budget"]:
+            self.stdout.write(self.style.ERROR(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,194 @@
+import time
+from collections import deque
+
+from chat_with_your_data_api.models import Document, ReindexRun
+from chat_with_your_data_api.pipeline import analyze_text, set_processes, submit
+from chat_with_your_data_api.qdrant import (ensure_collection, index_version,
+                                            reindex_document, tenant_model)
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        "Reindexes the documents of all or selected users with a pool of worker "
+        "processes, checkpointing the progress so an interrupted run can resume"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", nargs="*", default=[], help="auth0 ids, defaults to all")
+        parser.add_argument(
+            "--documents", nargs="*", type=int, default=[], help="Document ids, defaults to all"
+        )
+        parser.add_argument("--processes", type=int, default=2)
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Also reindex documents whose index is up to date, e.g. after losing Qdrant data",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last unfinished run and retry the documents that failed in it",
+        )
+        parser.add_argument(
+            "--progress-interval", type=float, default=10.0, help="Seconds between progress lines"
+        )
+
+    def handle(self, *args, **options):
+        set_processes(options["processes"])
+        run = None
+        if options["resume"]:
+            run = (
+                ReindexRun.objects.filter(status__in=["running", "failed"])
+                .order_by("-started_at")
+                .first()
+            )
+            if run is None:
+                self.stdout.write(self.style.WARNING("No unfinished run, starting a new one"))
+        if run is None:
+            run = ReindexRun.objects.create(
+                users=options["users"], documents=options["documents"], force=options["force"]
+            )
+        else:
+            # Documents deleted since they failed are not retried
+            run.failed_documents = list(
+                Document.objects.filter(id__in=run.failed_documents, status="ready")
+                .order_by("id")
+                .values_list("id", flat=True)
+            )
+            run.status = "running"
+            run.save(update_fields=["failed_documents", "status", "updated_at"])
+            self.stdout.write(
+                f"Resuming run {run.id} after document {run.last_document_id} "
+                f"({run.documents_done} documents done, "
+                f"{len(run.failed_documents)} failed documents to retry)"
+            )
+
+        documents = Document.objects.filter(
+            Q(id__gt=run.last_document_id) | Q(id__in=run.failed_documents), status="ready"
+        )
+        if run.users:
+            documents = documents.filter(user__auth0_id__in=run.users)
+        if run.documents:
+            documents = documents.filter(id__in=run.documents)
+        documents = documents.select_related("user").order_by("id")
+        total = documents.count()
+
+        # Collections lost in an outage are created again before filling them
+        models = {}
+        # Without order_by() the ordering by id would make every document distinct
+        for auth0_id in documents.order_by().values_list("user__auth0_id", flat=True).distinct():
+            [_, id] = auth0_id.split("|")
+            ensure_collection(id)
+            models[id] = tenant_model(id)
+
+        self.stats = {"documents": 0, "skipped": 0, "failed": 0, "sentences": 0, "vectors": 0}
+        self.start = self.last_report = time.perf_counter()
+        pending = deque()
+        window = max(options["processes"], 1) * 2
+        for document in self.batches(documents, window):
+            [_, id] = document.user.auth0_id.split("|")
+            future = None
+            # Like is_indexed, with the tenant's model looked up once
+            if run.force or document.index_version != index_version(document, models[id]):
+                future = submit(
+                    analyze_text,
+                    document.text,
+                    document.lang,
+                    document.current_parse(),
+                    models[id],
+                )
+            pending.append((document, id, future))
+
+            # Results are stored in id order, which keeps the checkpoint exact
+            while len(pending) >= window:
+                self.finish(run, *pending.popleft())
+                self.report(total, options["progress_interval"])
+        while pending:
+            self.finish(run, *pending.popleft())
+            self.report(total, options["progress_interval"])
+
+        run.status = "failed" if run.failed_documents else "done"
+        run.finished_at = timezone.now()
+        run.save(update_fields=["status", "finished_at", "updated_at"])
+        self.report(total, 0)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reindexed {self.stats['documents'] - self.stats['skipped'] - self.stats['failed']} "
+                f"documents, skipped {self.stats['skipped']} up to date, "
+                f"{self.stats['failed']} failed"
+            )
+        )
+        if run.failed_documents:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Failed documents: {', '.join(map(str, run.failed_documents))}, "
+                    "retry them with --resume"
+                )
+            )
+
+    def batches(self, documents, size):
+        # Keyset pagination instead of a server-side cursor, which SQLite
+        # cannot keep open while the results are written
+        last_id = 0
+        while True:
+            batch = list(documents.filter(id__gt=last_id)[:size])
+            if not batch:
+                return
+            yield from batch
+            last_id = batch[-1].id
+
+    def finish(self, run, document, id, future):
+        self.stats["documents"] += 1
+        failed = False
+        if future is None:
+            self.stats["skipped"] += 1
+        else:
+            try:
+                analysis = future.result()
+                reindex_document(id, document, analysis, force=True)
+            except Exception as e:
+                self.stats["failed"] += 1
+                self.stdout.write(self.style.WARNING(f"Failed document {document.id}: {e}"))
+                failed = True
+            else:
+                self.stats["sentences"] += len(analysis["sentences"])
+                self.stats["vectors"] += analysis["encoded"]
+                run.sentences_done += len(analysis["sentences"])
+
+        if failed and document.id not in run.failed_documents:
+            run.failed_documents.append(document.id)
+        elif not failed and document.id in run.failed_documents:
+            run.failed_documents.remove(document.id)
+
+        # Retried documents lie before the checkpoint and were counted already
+        if document.id > run.last_document_id:
+            run.last_document_id = document.id
+            run.documents_done += 1
+        run.save(
+            update_fields=[
+                "last_document_id",
+                "documents_done",
+                "sentences_done",
+                "failed_documents",
+                "updated_at",
+            ]
+        )
+
+    def report(self, total, interval):
+        now = time.perf_counter()
+        if now - self.last_report < interval:
+            return
+        self.last_report = now
+        elapsed = max(now - self.start, 1e-9)
+        done = self.stats["documents"]
+        rate = done / elapsed
+        eta = (total - done) / rate if rate else 0
+        self.stdout.write(
+            f"{done}/{total} documents, {rate:.2f} docs/s, "
+            f"{self.stats['sentences'] / elapsed:.1f} sentences/s, "
+            f"{self.stats['vectors'] / elapsed:.1f} vectors/s, "
+            f"ETA {time.strftime('%H:%M:%S', time.gmtime(eta))}"
+        )
@@ -0,0 +1,21 @@
+from chat_with_your_data_api.embedding import registry, warm_up
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Loads the models and reports their load time and memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            help="de, en, transformer and/or summarizer, defaults to all",
+        )
+
+    def handle(self, *args, **options):
+        warm_up(options["models"])
+        for name, stats in registry.stats().items():
+            self.stdout.write(
+                f"{name}: loaded in {stats['load_seconds']:.1f}s, {stats['memory_mb']:.0f} MB"
+                + ("" if stats["loaded"] else " (unloaded)")
+            )
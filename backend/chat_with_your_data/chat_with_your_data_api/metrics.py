@@ -0,0 +1,59 @@
+import bisect
+import threading
+
+# Metrics are kept per process; every gunicorn worker reports its own.
+
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+__lock = threading.Lock()
+__counters = {}
+__gauges = {}
+__histograms = {}
+
+
+def inc(name, value=1):
+    with __lock:
+        __counters[name] = __counters.get(name, 0) + value
+
+
+def add_gauge(name, value):
+    with __lock:
+        __gauges[name] = __gauges.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    with __lock:
+        __gauges[name] = value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS):
+    """Records a value in a histogram with the given upper bucket bounds."""
+    with __lock:
+        histogram = __histograms.get(name)
+        if histogram is None:
+            histogram = {
+                "buckets": list(buckets),
+                "counts": [0] * (len(buckets) + 1),
+                "sum": 0,
+                "count": 0,
+            }
+            __histograms[name] = histogram
+        histogram["counts"][bisect.bisect_left(histogram["buckets"], value)] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def snapshot():
+    """
+    Returns all metrics of this process. Histogram counts are per bucket, the
+    last one counting the values above the largest bound.
+    """
+    with __lock:
+        return {
+            "counters": dict(__counters),
+            "gauges": dict(__gauges),
+            "histograms": {
+                name: {**histogram, "counts": list(histogram["counts"])}
+                for name, histogram in __histograms.items()
+            },
+        }
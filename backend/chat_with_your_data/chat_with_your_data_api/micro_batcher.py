@@ -0,0 +1,75 @@
+import queue
+import threading
+import time
+
+from . import metrics
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128]
+WAIT_BUCKETS = [0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1]
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent single-item calls into one batched call of encode.
+
+    A batch is run once max_batch_size items are waiting or max_wait seconds
+    after its first item arrived, whichever comes first. Each caller blocks
+    until its own result is ready. The batch sizes and the time items waited
+    for their batch to start are recorded as the <name>_batch_size and
+    <name>_batch_wait_seconds histograms.
+    """
+
+    def __init__(self, name, encode, max_batch_size=32, max_wait=0.005):
+        self.name = name
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.__queue = queue.Queue()
+        self.__worker = None
+        self.__lock = threading.Lock()
+
+    def submit(self, item):
+        request = {"item": item, "queued": time.perf_counter(), "done": threading.Event()}
+        self.__ensure_worker()
+        self.__queue.put(request)
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["result"]
+
+    def __ensure_worker(self):
+        with self.__lock:
+            # Also after a fork, which does not copy the thread
+            if self.__worker is None or not self.__worker.is_alive():
+                self.__worker = threading.Thread(target=self.__run, daemon=True)
+                self.__worker.start()
+
+    def __run(self):
+        while True:
+            batch = [self.__queue.get()]
+            deadline = batch[0]["queued"] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.__queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            start = time.perf_counter()
+            metrics.observe(f"{self.name}_batch_size", len(batch), BATCH_SIZE_BUCKETS)
+            for request in batch:
+                metrics.observe(
+                    f"{self.name}_batch_wait_seconds", start - request["queued"], WAIT_BUCKETS
+                )
+            try:
+                results = self.encode([request["item"] for request in batch])
+            except Exception as e:
+                for request in batch:
+                    request["error"] = e
+            else:
+                for request, result in zip(batch, results):
+                    request["result"] = result
+            for request in batch:
+                request["done"].set()
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.9 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_with_your_data_api', '0019_document_headings_alter_room_settings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='parsed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
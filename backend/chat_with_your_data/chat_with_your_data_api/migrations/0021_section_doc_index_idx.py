@@ -0,0 +1,17 @@
+# Generated by Django 5.0.9 on 2026-10-18 10:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_with_your_data_api', '0020_document_parsed'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='section',
+            index=models.Index(fields=['document', 'doc_index'], name='section_doc_index_idx'),
+        ),
+    ]
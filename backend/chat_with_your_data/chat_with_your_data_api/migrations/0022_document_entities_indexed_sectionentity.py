@@ -0,0 +1,30 @@
+# Generated by Django 5.0.9 on 2026-10-18 11:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_with_your_data_api', '0021_section_doc_index_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='entities_indexed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='SectionEntity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.CharField(max_length=255)),
+                ('label', models.CharField(max_length=32)),
+                ('start_char', models.PositiveIntegerField()),
+                ('end_char', models.PositiveIntegerField()),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='chat_with_your_data_api.section')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.9 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_with_your_data_api', '0024_document_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='index_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
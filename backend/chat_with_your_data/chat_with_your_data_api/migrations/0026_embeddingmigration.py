@@ -0,0 +1,26 @@
+# Generated by Django 5.0.9 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_with_your_data_api', '0025_document_index_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingMigration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tenant', models.CharField(db_index=True, max_length=255)),
+                ('target_model', models.CharField(max_length=255)),
+                ('target_collection', models.CharField(max_length=255)),
+                ('status', models.CharField(default='building', max_length=16)),
+                ('last_document_id', models.BigIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('switched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.9 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_with_your_data_api', '0026_embeddingmigration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReindexRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('users', models.JSONField(default=list)),
+                ('documents', models.JSONField(default=list)),
+                ('force', models.BooleanField(default=False)),
+                ('status', models.CharField(default='running', max_length=16)),
+                ('last_document_id', models.BigIntegerField(default=0)),
+                ('documents_done', models.PositiveIntegerField(default=0)),
+                ('sentences_done', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
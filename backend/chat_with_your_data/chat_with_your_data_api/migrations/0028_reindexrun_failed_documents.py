@@ -0,0 +1,18 @@
+# Generated by Django 5.0.9 on 2026-10-18 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_with_your_data_api', '0027_reindexrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reindexrun',
+            name='failed_documents',
+            field=models.JSONField(default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.9 on 2026-10-18 22:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat_with_your_data_api', '0029_ingestionjob_heartbeat_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='parsed_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
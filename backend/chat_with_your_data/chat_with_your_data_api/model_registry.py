@@ -0,0 +1,105 @@
+import gc
+import os
+import resource
+import threading
+import time
+
+
+def rss_mb():
+    """Returns the resident memory of this process in MB."""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        # Peak instead of current memory where /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+class ModelRegistry:
+    """
+    Loads models on first use (or at an explicit warm-up) and keeps them
+    until they are unloaded.
+
+    Each load is timed and the growth of the resident memory is attributed to
+    the model. With a memory budget (in MB, 0 for none), the least recently
+    used models are unloaded whenever loading another one would exceed it.
+    """
+
+    def __init__(self, memory_budget_mb=0):
+        self.memory_budget_mb = memory_budget_mb
+        self.__loaders = {}
+        self.__models = {}
+        self.__stats = {}
+        self.__lock = threading.RLock()
+
+    def register(self, name, loader):
+        self.__loaders[name] = loader
+
+    def is_registered(self, name):
+        return name in self.__loaders
+
+    def get(self, name):
+        model = self.__models.get(name)
+        if model is None:
+            with self.__lock:
+                model = self.__models.get(name)
+                if model is None:
+                    model = self.__load(name)
+        self.__stats[name]["last_used"] = time.time()
+        return model
+
+    def warm_up(self, names=None):
+        """Loads the given models, or all registered ones, ahead of their first use."""
+        for name in names or list(self.__loaders):
+            self.get(name)
+
+    def unload(self, name):
+        with self.__lock:
+            if self.__models.pop(name, None) is None:
+                return
+            self.__stats[name]["loaded"] = False
+            # Release the weights now instead of at the next collection
+            gc.collect()
+            print(f"Unloaded model {name} ({self.__stats[name]['memory_mb']:.0f} MB)")
+
+    def stats(self):
+        """Returns the load time, memory and last use of every model loaded so far."""
+        return {name: dict(stats) for name, stats in self.__stats.items()}
+
+    def __load(self, name):
+        loader = self.__loaders[name]
+        expected = self.__stats.get(name, {}).get("memory_mb", 0)
+        self.__make_room(expected)
+
+        memory = rss_mb()
+        start = time.perf_counter()
+        model = loader()
+        load_seconds = time.perf_counter() - start
+        memory_mb = max(rss_mb() - memory, 0)
+
+        self.__models[name] = model
+        self.__stats[name] = {
+            "loaded": True,
+            "load_seconds": load_seconds,
+            "memory_mb": memory_mb,
+            "last_used": time.time(),
+        }
+        print(f"Loaded model {name} in {load_seconds:.1f}s ({memory_mb:.0f} MB)")
+        self.__make_room(0)
+        return model
+
+    def __make_room(self, needed_mb):
+        if self.memory_budget_mb <= 0:
+            return
+        loaded = sorted(
+            (name for name in self.__models),
+            key=lambda name: self.__stats[name]["last_used"],
+        )
+        used = sum(self.__stats[name]["memory_mb"] for name in loaded)
+        # The most recently used model always stays, even if it alone exceeds the budget
+        for name in loaded[:-1]:
+            if used + needed_mb <= self.memory_budget_mb:
+                break
+            used -= self.__stats[name]["memory_mb"]
+            self.unload(name)
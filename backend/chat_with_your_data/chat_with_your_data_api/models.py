@@ -1,19 +1,14 @@
-import os
+import hashlib
 from pprint import pprint
 
-import tiktoken
 from django.db import models
 from django.db.models import JSONField
-from langchain.llms import OpenAI
 
+from .llm import get_encoder
 from .room_settings import RoomSettings
 
 LLM_MAX_TOKENS = 4098
 
-token_encoder = "cl100k_base"  # used for ChatGPT 3.5 Turbo and ChatGPT 4
-llm = OpenAI(openai_api_key=os.getenv("OPEN_AI_KEY"))
-encoder = tiktoken.get_encoding(token_encoder)
-
 
 class User(models.Model):
     auth0_id = models.CharField(max_length=255, unique=True, null=False)
@@ -34,10 +29,71 @@ class Document(models.Model):
     fileSize = models.PositiveIntegerField(default=0)
     uploadedAt = models.DateTimeField(auto_now_add=True)
     headings = models.JSONField(blank=True, null=True)
+    parsed = models.BinaryField(blank=True, null=True)  # spaCy DocBin of text
+    parsed_version = models.CharField(max_length=64, blank=True, default="")  # parse_version of parsed
+    entities_indexed = models.BooleanField(default=False)
+    status = models.CharField(max_length=16, default="ready")  # processing, ready or failed
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)  # SHA-256 of the uploaded file
+    index_version = models.CharField(max_length=64, blank=True, default="")  # see qdrant.index_version
 
     def __str__(self):
         return self.filename
 
+    def parse_version(self, lang=None):
+        """Identifies the text and language (by default the document's) a parse is made from."""
+        return hashlib.sha256(f"{lang or self.lang}\0{self.text}".encode("utf-8")).hexdigest()
+
+    def current_parse(self):
+        """Returns the stored parse if it was made from the current text, otherwise None."""
+        if self.parsed and self.parsed_version == self.parse_version():
+            return bytes(self.parsed)
+        return None
+
+
+class IngestionJob(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, default="queued", db_index=True)  # queued, processing, done or failed
+    files = models.JSONField(default=list)  # [{"document": id, "path": str, "filename": str}]
+    timings = models.JSONField(default=dict)  # seconds per document and stage
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)  # last sign of life of its worker
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.user.auth0_id} + {self.id}"
+
+
+class EmbeddingMigration(models.Model):
+    tenant = models.CharField(max_length=255, db_index=True)  # alias the user collection is reached through
+    target_model = models.CharField(max_length=255)
+    target_collection = models.CharField(max_length=255)
+    status = models.CharField(max_length=16, default="building")  # building or switched
+    last_document_id = models.BigIntegerField(default=0)  # checkpoint to resume from
+    created_at = models.DateTimeField(auto_now_add=True)
+    switched_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.tenant} -> {self.target_model}"
+
+
+class ReindexRun(models.Model):
+    users = models.JSONField(default=list)  # auth0 ids, empty for all users
+    documents = models.JSONField(default=list)  # document ids, empty for all documents
+    force = models.BooleanField(default=False)  # also reindex up-to-date documents
+    status = models.CharField(max_length=16, default="running")  # running, done or failed
+    last_document_id = models.BigIntegerField(default=0)  # checkpoint to resume from
+    failed_documents = models.JSONField(default=list)  # document ids retried on resume
+    documents_done = models.PositiveIntegerField(default=0)
+    sentences_done = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Reindex {self.id} ({self.status})"
+
 
 class Section(models.Model):
     document = models.ForeignKey(
@@ -46,10 +102,26 @@ class Section(models.Model):
     content = models.TextField()
     doc_index = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["document", "doc_index"], name="section_doc_index_idx"),
+        ]
+
     def __str__(self):
         return self.document.filename
 
 
+class SectionEntity(models.Model):
+    section = models.ForeignKey(Section, on_delete=models.CASCADE)
+    text = models.CharField(max_length=255)
+    label = models.CharField(max_length=32)
+    start_char = models.PositiveIntegerField()  # relative to the sentence
+    end_char = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.label}: {self.text}"
+
+
 class Room(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=False)
     name = models.CharField(max_length=255, default="Room")
@@ -82,7 +154,7 @@ class Room(models.Model):
             for line in context:
                 content = line.content
                 messageLine = {"role": line.role, "content": content}
-                token_size = len(encoder.encode(str(messageLine)))
+                token_size = len(get_encoder().encode(str(messageLine)))
                 msg_length = msg_length + token_size
 
                 if not get_all:
@@ -0,0 +1,52 @@
+import os
+import time
+
+from . import metrics
+
+__inference_threads = int(os.getenv("INFERENCE_THREADS", 2))
+__pool = None
+
+
+def __is_gevent():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("threading")
+
+
+def run(fn, *args, **kwargs):
+    """
+    Runs CPU-bound model work, or a blocking call to the inference server.
+    Under gevent it runs in a pool of
+    INFERENCE_THREADS native threads while the calling greenlet waits, so the
+    event loop keeps serving the other requests of the worker; elsewhere fn
+    is called directly.
+
+    The number of calls waiting for a thread is the inference_queue_depth
+    gauge, the time they waited the inference_queue_wait_seconds histogram.
+    """
+    global __pool
+    if __inference_threads <= 0 or not __is_gevent():
+        return fn(*args, **kwargs)
+
+    if __pool is None:
+        from gevent.threadpool import ThreadPool
+
+        __pool = ThreadPool(__inference_threads)
+
+    queued = time.perf_counter()
+    metrics.add_gauge("inference_queue_depth", 1)
+
+    def started():
+        metrics.add_gauge("inference_queue_depth", -1)
+        metrics.observe("inference_queue_wait_seconds", time.perf_counter() - queued)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            metrics.observe(
+                f"inference_seconds.{fn.__name__.strip('_')}", time.perf_counter() - start
+            )
+
+    return __pool.apply(started)
@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from .embedding import (clean_join, deserialize_doc, embed_text, fingerprint,
+                        prepare_text, sentence_entities, serialize_doc,
+                        vectorize)
+from .embedding_cache import EmbeddingCache, cache
+from .file_importer import extract_text
+
+# This module must not import Django: its functions run in worker processes
+# that only hold the models.
+
+__embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+__ingest_processes = int(os.getenv("INGEST_PROCESSES", 2))
+__pool = None
+__pool_lock = threading.Lock()
+
+
+def analyze_text(text, lang, parsed=None, model_name=None):
+    """
+    Parses and embeds a document text, with the given transformer model or
+    the default one. A serialized parse of the text (Document.parsed) is
+    reused instead of running the spaCy pipeline again.
+
+    Returns:
+        dict: The sentences, their entity spans and vectors, the model of the
+        vectors, the number of vectors encoded (not taken from the cache), the
+        serialized parse and the time spent per stage.
+    """
+    timings = {}
+    start = time.perf_counter()
+    if parsed:
+        embedded_text = deserialize_doc(parsed, lang)
+    else:
+        embedded_text = embed_text(text, lang)
+    sentences = [clean_join(tokens) for tokens in prepare_text(embedded_text)]
+    entities = sentence_entities(embedded_text)
+    parsed = parsed or serialize_doc(embedded_text)
+    timings["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    misses = cache.misses if cache else 0
+    vectors = vectorize_cached(sentences, model_name)
+    encoded = cache.misses - misses if cache else len(sentences)
+    timings["embed"] = time.perf_counter() - start
+    if sentences:
+        print(
+            f"Embedded {len(sentences)} sentences in {timings['embed']:.2f}s "
+            f"({len(sentences) / max(timings['embed'], 1e-9):.1f} sentences/s, "
+            f"batch size {__embedding_batch_size}"
+            + (f", cache hits {cache.hits}, misses {cache.misses})" if cache else ")")
+        )
+
+    return {
+        "sentences": sentences,
+        "entities": entities,
+        "vectors": vectors,
+        "model": model_name,
+        "encoded": encoded,
+        "parsed": parsed,
+        "timings": timings,
+    }
+
+
+def vectorize_cached(sentences, model_name=None):
+    """
+    Returns the vectors of the sentences, encoding in batches only those that
+    are not in the embedding cache yet.
+    """
+    if cache is None:
+        keys = [None] * len(sentences)
+        cached = {}
+    else:
+        model_fingerprint = fingerprint(model_name)
+        keys = [EmbeddingCache.key(sentence, model_fingerprint) for sentence in sentences]
+        cached = cache.get_many(keys)
+
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    computed = []
+    for offset in range(0, len(missing), __embedding_batch_size):
+        batch = [sentences[i] for i in missing[offset : offset + __embedding_batch_size]]
+        computed.extend(
+            vectorize(batch, batch_size=__embedding_batch_size, model_name=model_name)
+        )
+
+    if cache is not None and computed:
+        cache.put_many([(keys[i], vector) for i, vector in zip(missing, computed)])
+
+    vectors = [cached.get(key) for key in keys]
+    for i, vector in zip(missing, computed):
+        vectors[i] = vector
+    return vectors
+
+
+def analyze_file(file_path, file_name, lang, model_name=None):
+    """Extracts the text of a file and analyzes it like analyze_text."""
+    start = time.perf_counter()
+    text = extract_text(file_path, file_name)
+    extract_time = time.perf_counter() - start
+
+    analysis = analyze_text(text, lang, model_name=model_name)
+    analysis["text"] = text
+    analysis["timings"]["extract"] = extract_time
+    return analysis
+
+
+def set_processes(processes):
+    """Sets the size of the process pool; call before the first submit."""
+    global __ingest_processes
+    __ingest_processes = processes
+
+
+def submit(fn, *args):
+    """
+    Runs fn in the ingestion process pool (INGEST_PROCESSES workers, which
+    keep their models loaded between tasks) and returns its future. With
+    INGEST_PROCESSES=0 fn runs right away in the calling process.
+    """
+    global __pool
+    if __ingest_processes <= 0:
+        return __run_inline(fn, *args)
+
+    with __pool_lock:
+        if __pool is None:
+            __pool = __create_pool()
+        pool = __pool
+    try:
+        return pool.submit(fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed while loading the models), which
+        # breaks the pool for good; later jobs get a new one
+        with __pool_lock:
+            if __pool is pool:
+                __pool = __create_pool()
+            pool = __pool
+        return pool.submit(fn, *args)
+
+
+def __create_pool():
+    return ProcessPoolExecutor(
+        max_workers=__ingest_processes,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+
+
+def __run_inline(fn, *args):
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
@@ -1,22 +1,33 @@
+import hashlib
 import json
 import os
+import time
 import uuid
-import re
+from concurrent.futures import ThreadPoolExecutor
 
-from qdrant_client import QdrantClient, http
+from qdrant_client import http
 from qdrant_client.http.models import Distance, VectorParams
-from qdrant_client.models import (FieldCondition, Filter, FilterSelector,
-                                  MatchValue, PointStruct)
+from qdrant_client.models import (BinaryQuantization, BinaryQuantizationConfig,
+                                  CollectionParamsDiff, CreateAlias,
+                                  CreateAliasOperation, DeleteAlias,
+                                  DeleteAliasOperation, Disabled,
+                                  FieldCondition, Filter, FilterSelector,
+                                  HnswConfigDiff, KeywordIndexParams,
+                                  KeywordIndexType, MatchAny, MatchValue,
+                                  PayloadSchemaType, PointStruct,
+                                  QuantizationSearchParams, Range,
+                                  ScalarQuantization,
+                                  ScalarQuantizationConfig, ScalarType,
+                                  SearchParams, VectorParamsDiff)
 
-from .embedding import embed_text, prepare_text, vectorize
-from .serializers import SectionSerializer
-
-__client = QdrantClient(
-    url=os.getenv("QDRANT_URL"),
-    api_key=os.getenv("QDRANT_SECRET"),
-    prefer_grpc=True
-)
+from django.db import transaction
+from django.utils import timezone
 
+from .anonymization import store_section_entities
+from .embedding import dimension, fingerprint
+from .models import EmbeddingMigration, Section
+from .pipeline import analyze_text, vectorize_cached
+from .qdrant_connection import get_client
 
 def __get_vec_distance():
     match os.getenv("VEC_DISTANCE", "COSINE"):
@@ -28,86 +39,732 @@ def __get_vec_distance():
             return Distance.EUCLIDEAN
 
 
+# Collection profiles: HNSW graph parameters, vector quantization and
+# whether vectors and payload live on disk instead of in RAM
+__collection_profiles = {
+    "default": {"quantization": "none", "on_disk": False},
+    "compact": {"quantization": "scalar", "on_disk": True},
+    "binary": {"quantization": "binary", "on_disk": True},
+}
+
+
+def __get_collection_profile(name=None):
+    profile = dict(
+        __collection_profiles[name or os.getenv("QDRANT_COLLECTION_PROFILE", "default")]
+    )
+    profile["hnsw_m"] = int(os.getenv("QDRANT_HNSW_M", 16))
+    profile["hnsw_ef_construct"] = int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", 100))
+    profile["oversampling"] = float(os.getenv("QDRANT_RESCORE_OVERSAMPLING", 2.0))
+    return profile
+
+
+def __get_quantization_config(profile):
+    match profile["quantization"]:
+        case "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(
+                    type=ScalarType.INT8, quantile=0.99, always_ram=True
+                )
+            )
+        case "binary":
+            return BinaryQuantization(
+                binary=BinaryQuantizationConfig(always_ram=True)
+            )
+        case _:
+            return None
+
+
 __collection_vec_size = os.getenv("VEC_SIZE", 768)
 __collection_vec_distance = __get_vec_distance()
+__collection_profile = __get_collection_profile()
+# Store section content and filename in the point payload, so
+# search hits can be served without reading the sections from Postgres
+__payload_content = os.getenv("QDRANT_PAYLOAD_CONTENT", "False").lower() == "true"
+# "per_user" keeps one collection per user, "shared" stores all users in one
+# collection whose points carry the user id in a tenant payload index
+__storage_mode = os.getenv("QDRANT_STORAGE_MODE", "per_user")
+__shared_collection_name = os.getenv("QDRANT_SHARED_COLLECTION", "documents")
+__shared_collection_ready = False
+# Large documents are upserted in bounded chunks, sent concurrently
+__upsert_chunk_size = int(os.getenv("QDRANT_UPSERT_CHUNK_SIZE", 256))
+__upsert_workers = int(os.getenv("QDRANT_UPSERT_WORKERS", 4))
+__upsert_retries = int(os.getenv("QDRANT_UPSERT_RETRIES", 3))
+# Point ids are derived from document id and doc_index, so re-ingesting a
+# document overwrites its points instead of adding new ones
+__point_namespace = uuid.UUID("5b0e8f3c-6a0d-4d7e-9a43-0d6f2c1f8e21")
+
+
+def __is_shared():
+    return __storage_mode == "shared"
+
+
+def is_shared():
+    """Whether all users are stored in one collection (QDRANT_STORAGE_MODE=shared)."""
+    return __is_shared()
+
+
+def __tenant_collection(name):
+    return __shared_collection_name if __is_shared() else name
+
+
+def __tenant_conditions(name):
+    if not __is_shared():
+        return []
+    return [FieldCondition(key="user_id", match=MatchValue(value=name))]
+
+
+def __ensure_shared_collection():
+    global __shared_collection_ready
+    if __shared_collection_ready:
+        return
+    if not __tenant_exists(__shared_collection_name):
+        __create_tenant_collection(__shared_collection_name)
+    __shared_collection_ready = True
+
+
+# Collections are reached through an alias named like the user (or the
+# shared collection), pointing at a physical collection per embedding model.
+# Switching to another model swaps the alias in one atomic operation.
+
+
+def __physical_collection(name, model_name=None):
+    model_hash = hashlib.sha1(fingerprint(model_name).encode("utf-8")).hexdigest()
+    return f"{name}__{model_hash[:8]}"
+
+
+def __alias_target(alias):
+    for description in get_client().get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def __tenant_exists(alias):
+    return __alias_target(alias) is not None or get_client().collection_exists(alias)
+
+
+def __switch_alias(alias, collection):
+    operations = []
+    if __alias_target(alias) is not None:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    elif get_client().collection_exists(alias):
+        raise RuntimeError(
+            f"Collection {alias} predates aliases, convert it with "
+            "manage.py convert_legacy_collections first"
+        )
+    operations.append(
+        CreateAliasOperation(
+            create_alias=CreateAlias(collection_name=collection, alias_name=alias)
+        )
+    )
+    get_client().update_collection_aliases(change_aliases_operations=operations)
+
+
+def __create_tenant_collection(alias, model_name=None):
+    collection = __physical_collection(alias, model_name)
+    __recreate_collection(
+        collection, model_name, tenant_index=alias == __shared_collection_name
+    )
+    __switch_alias(alias, collection)
+
+
+def __drop_tenant_collection(alias):
+    collection = __alias_target(alias)
+    if collection is None:
+        get_client().delete_collection(collection_name=alias)
+        return
+    get_client().update_collection_aliases(
+        change_aliases_operations=[
+            DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias))
+        ]
+    )
+    get_client().delete_collection(collection_name=collection)
+
+
+def convert_legacy_collection(name, batch_size=256):
+    """
+    Moves a collection created before aliases were used (and so named like
+    its alias) into a physical collection reached through the alias.
+
+    The points are copied first and only then is the old collection replaced
+    by the alias, so no data is dropped. Qdrant cannot create an alias named
+    like an existing collection, so searches fail for the moment between
+    deleting the old collection and creating the alias; run this when the
+    collection sees little traffic. Safe to run again after an interruption.
+
+    Returns:
+        bool: Whether the collection had to be converted.
+    """
+    alias = __tenant_collection(name)
+    if __alias_target(alias) is not None:
+        return False
+    physical = __physical_collection(alias, tenant_model(name))
+    if not get_client().collection_exists(alias):
+        # Interrupted after the old collection was deleted
+        if not get_client().collection_exists(physical):
+            return False
+        __switch_alias(alias, physical)
+        return True
+
+    if not get_client().collection_exists(physical):
+        __recreate_collection(
+            physical, tenant_model(name), tenant_index=alias == __shared_collection_name
+        )
+    offset = None
+    while True:
+        records, offset = get_client().scroll(
+            collection_name=alias,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        __upsert_points(
+            physical,
+            [
+                PointStruct(id=record.id, vector=record.vector, payload=record.payload)
+                for record in records
+            ],
+        )
+        if offset is None:
+            break
+
+    source_count = get_client().count(collection_name=alias, exact=True).count
+    copied_count = get_client().count(collection_name=physical, exact=True).count
+    if copied_count < source_count:
+        raise RuntimeError(
+            f"Copied {copied_count} of {source_count} points of {alias}, run again"
+        )
+    get_client().delete_collection(collection_name=alias)
+    __switch_alias(alias, physical)
+    return True
+
+
+def tenant_model(name):
+    """
+    Returns the transformer model the user's collection was migrated to, or
+    None for the default model (TRANSFORMER_MODEL).
+    """
+    migration = (
+        EmbeddingMigration.objects.filter(
+            tenant=__tenant_collection(name), status="switched"
+        )
+        .order_by("-switched_at")
+        .first()
+    )
+    return migration.target_model if migration else None
 
 
 def create_collection(name):
-    __client.recreate_collection(
+    """
+    Creates an empty collection for the user. In shared mode the user's
+    points are removed from the shared collection instead.
+    """
+    if __is_shared():
+        __ensure_shared_collection()
+        delete_collection(name)
+        return
+    model_name = tenant_model(name)
+    if __tenant_exists(name):
+        __drop_tenant_collection(name)
+    __create_tenant_collection(name, model_name)
+
+
+def ensure_collection(name):
+    """Creates the user's collection unless it exists, never dropping data."""
+    if __is_shared():
+        __ensure_shared_collection()
+    elif not __tenant_exists(name):
+        __create_tenant_collection(name, tenant_model(name))
+
+
+def __recreate_collection(name, model_name=None, tenant_index=False):
+    vec_size = __collection_vec_size if model_name is None else dimension(model_name)
+    get_client().recreate_collection(
         collection_name=name,
         vectors_config=VectorParams(
-            size=__collection_vec_size, distance=__collection_vec_distance
+            size=vec_size,
+            distance=__collection_vec_distance,
+            on_disk=__collection_profile["on_disk"],
         ),
+        hnsw_config=HnswConfigDiff(
+            m=__collection_profile["hnsw_m"],
+            ef_construct=__collection_profile["hnsw_ef_construct"],
+        ),
+        quantization_config=__get_quantization_config(__collection_profile),
+        on_disk_payload=__collection_profile["on_disk"],
+    )
+    __create_payload_index(name)
+    if tenant_index:
+        __create_tenant_index(name)
+
+
+def __create_tenant_index(name):
+    get_client().create_payload_index(
+        collection_name=name,
+        field_name="user_id",
+        field_schema=KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True),
+    )
+
+
+def apply_collection_profile(name, profile_name=None):
+    """Re-applies a collection profile to an existing collection."""
+    profile = __get_collection_profile(profile_name)
+    get_client().update_collection(
+        collection_name=__tenant_collection(name),
+        vectors_config={"": VectorParamsDiff(on_disk=profile["on_disk"])},
+        hnsw_config=HnswConfigDiff(
+            m=profile["hnsw_m"], ef_construct=profile["hnsw_ef_construct"]
+        ),
+        quantization_config=__get_quantization_config(profile) or Disabled.DISABLED,
+        collection_params=CollectionParamsDiff(on_disk_payload=profile["on_disk"]),
+    )
+
+
+def create_payload_index(name):
+    __create_payload_index(__tenant_collection(name))
+
+
+def __create_payload_index(collection):
+    # Lets filtered HNSW search restrict candidates to the room's documents
+    get_client().create_payload_index(
+        collection_name=collection,
+        field_name="document_id",
+        field_schema=PayloadSchemaType.INTEGER,
     )
 
 
 def delete_collection(name):
-    __client.delete_collection(collection_name=name)
+    if __is_shared():
+        __delete_points(name, Filter(must=__tenant_conditions(name)))
+        return
+    __drop_tenant_collection(name)
+
+
+def move_to_shared_collection(name, delete_source=False, batch_size=256):
+    """
+    Copies the points of a per-user collection into the shared collection,
+    tagged with the user id. Returns the number of copied points.
+    """
+    __ensure_shared_collection()
+
+    copied = 0
+    offset = None
+    while True:
+        records, offset = get_client().scroll(
+            collection_name=name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if records:
+            __upsert_chunk(
+                __shared_collection_name,
+                [
+                    PointStruct(
+                        id=record.id,
+                        vector=record.vector,
+                        payload={**record.payload, "user_id": name},
+                    )
+                    for record in records
+                ],
+                wait=True,
+            )
+            copied += len(records)
+        if offset is None:
+            break
+
+    if delete_source:
+        __drop_tenant_collection(name)
+    return copied
 
 
 # def search(collection_name, vector):
-#    result = __client.search(
+#    result = get_client().search(
 #        collection_name=collection_name, query_vector=vector.tolist(), limit=3
 #    )
 #    return result
 
 
 def search(collection_name, vector, document_ids):
-    # Konvertiere die Liste der Dokument-IDs in eine Liste von MatchValue Bedingungen
-    document_id_conditions = [MatchValue(value=doc_id) for doc_id in document_ids]
-    # Erstelle einen Filter, der nur Punkte zurückgibt, deren document_id in der Liste der ausgewählten Dokument-IDs enthalten ist
+    # Nur Punkte der ausgewählten Dokumente zurückgeben
     filter = Filter(
-        should=[
-            FieldCondition(key="document_id", match=condition)
-            for condition in document_id_conditions
+        must=[
+            FieldCondition(
+                key="document_id",
+                match=MatchAny(any=[int(doc_id) for doc_id in document_ids]),
+            ),
+            *__tenant_conditions(collection_name),
         ],
-        # should_score=True
     )
 
-    # Führe die Suche mit dem definierten Filter aus
-    result = __client.search(
-        collection_name=collection_name,
+    # Quantized vectors only preselect candidates, the originals rescore them
+    search_params = None
+    if __collection_profile["quantization"] != "none":
+        search_params = SearchParams(
+            quantization=QuantizationSearchParams(
+                rescore=True, oversampling=__collection_profile["oversampling"]
+            )
+        )
+
+    result = get_client().search(
+        collection_name=__tenant_collection(collection_name),
         query_vector=vector.tolist(),
         limit=3,
         query_filter=filter,
+        search_params=search_params,
     )
     return result
 
 
-def insert_text(collection_name, document, lang):
-    embedded_text = embed_text(document.text, lang)
-    tokens = prepare_text(embedded_text)
-    points = []
-    for i, token in enumerate(tokens):
-        content = clean_join(token)
-        section = {"document": document.id, "content": content, "doc_index": i}
-        serializer = SectionSerializer(data=section)
-        if serializer.is_valid():
-            result = serializer.save()
-        else:
-            return serializer.errors
-
-        vector = vectorize(content)
-        point = PointStruct(
-            id=str(uuid.uuid4()),
-            vector=vector.tolist(),
-            payload={"section_id": result.id, "document_id": document.id},
-        )
-        points.append(point)
-    __insert_points(collection_name, points)
+def search_facts(collection_name, vector, document_ids):
+    """
+    Searches the collection and returns the hits as fact dicts with the keys
+    section_id, document_id, doc_index, content, filename and score.
+
+    Hits whose payload lacks the section content are completed with a single
+    Postgres lookup.
+    """
+    results = search(collection_name, vector, document_ids)
+    facts = [
+        {
+            "section_id": result.payload.get("section_id"),
+            "document_id": result.payload.get("document_id"),
+            "doc_index": result.payload.get("doc_index"),
+            "content": result.payload.get("content"),
+            "filename": result.payload.get("filename"),
+            "score": result.score,
+        }
+        for result in results
+    ]
+
+    missing = [fact["section_id"] for fact in facts if fact["content"] is None]
+    if missing:
+        sections = Section.objects.select_related("document").in_bulk(missing)
+        for fact in facts:
+            section = sections.get(fact["section_id"])
+            if fact["content"] is None and section is not None:
+                fact["doc_index"] = section.doc_index
+                fact["content"] = section.content
+                fact["filename"] = section.document.filename
+        facts = [fact for fact in facts if fact["content"] is not None]
+    return facts
+
+
+def insert_text(collection_name, document, lang, timings=None, analysis=None):
+    """
+    Stores the sections of a document and upserts their vectors. The analysis
+    (see pipeline.analyze_text) is computed here unless it is passed in.
+    """
+    timings = {} if timings is None else timings
+    if analysis is None:
+        parsed = document.current_parse() if lang == document.lang else None
+        analysis = analyze_text(document.text, lang, parsed, tenant_model(collection_name))
+    timings.update(analysis["timings"])
+
+    sections = __store_sections(document, lang, analysis, timings)
+    __upsert_sections(collection_name, document, sections, analysis, timings)
     return True
 
 
+def __store_sections(document, lang, analysis, timings):
+    start = time.perf_counter()
+    sections = Section.objects.bulk_create(
+        [
+            Section(document=document, content=content, doc_index=i)
+            for i, content in enumerate(analysis["sentences"])
+        ]
+    )
+    store_section_entities(sections, analysis["entities"])
+    document.parsed = analysis["parsed"]
+    document.parsed_version = document.parse_version(lang)
+    document.entities_indexed = True
+    document.save(update_fields=["parsed", "parsed_version", "entities_indexed"])
+    timings["store"] = time.perf_counter() - start
+    return sections
+
+
+def __upsert_sections(collection_name, document, sections, analysis, timings):
+    start = time.perf_counter()
+    __write_document(
+        collection_name,
+        document,
+        sections,
+        [vector.tolist() for vector in analysis["vectors"]],
+        analysis["model"],
+    )
+    timings["upsert"] = time.perf_counter() - start
+
+
+def __write_document(collection_name, document, sections, vectors, model_name):
+    # The vectors were computed with model_name, possibly before the alias
+    # was switched to another model; the sections are then embedded again
+    # with the tenant's current model and their points overwritten
+    sections = list(sections)
+    while True:
+        points = [
+            PointStruct(
+                id=__point_id(document, section),
+                vector=vector,
+                payload=__point_payload(collection_name, document, section),
+            )
+            for section, vector in zip(sections, vectors)
+        ]
+        __insert_points(collection_name, points)
+        __write_shadow_collections(collection_name, document, sections)
+        current_model = tenant_model(collection_name)
+        if current_model == model_name:
+            break
+        model_name = current_model
+        vectors = [
+            vector.tolist()
+            for vector in vectorize_cached(
+                [section.content for section in sections], model_name
+            )
+        ]
+
+    # Only set once the points are written, so a failed upsert is retried
+    document.index_version = index_version(document, model_name)
+    document.save(update_fields=["index_version"])
+
+
+def index_version(document, model_name=None):
+    """Changes whenever the text, language or embedding model of a document does."""
+    return hashlib.sha256(
+        f"{fingerprint(model_name)}\0{document.lang}\0{document.text}".encode("utf-8")
+    ).hexdigest()
+
+
+def is_indexed(collection_name, document):
+    """Whether the document's points match its text, language and the tenant's model."""
+    return document.index_version == index_version(document, tenant_model(collection_name))
+
+
+def reindex_document(collection_name, document, analysis=None, force=False):
+    """
+    Re-ingests a document unless its index is up to date (or force is set).
+    The points are overwritten in place, so the document stays searchable
+    meanwhile. The analysis is computed here unless it is passed in.
+
+    Returns:
+        bool: Whether the document was re-ingested.
+    """
+    if not force and is_indexed(collection_name, document):
+        return False
+
+    if not document.index_version:
+        # Indexed before point ids were deterministic, nothing to overwrite
+        delete_text(collection_name, document)
+
+    if analysis is None:
+        analysis = analyze_text(
+            document.text, document.lang, document.current_parse(), tenant_model(collection_name)
+        )
+
+    # Commit the new sections before upserting, so the upsert retries do not
+    # hold the transaction open; the point payloads refer to committed rows
+    timings = {}
+    with transaction.atomic():
+        Section.objects.filter(document=document).delete()
+        sections = __store_sections(document, document.lang, analysis, timings)
+    __upsert_sections(collection_name, document, sections, analysis, timings)
+
+    # Remove the points of sentences the document no longer has
+    section_count = Section.objects.filter(document=document).count()
+    __delete_points(
+        collection_name,
+        Filter(
+            must=[
+                FieldCondition(
+                    key="document_id", match=MatchValue(value=int(document.id))
+                ),
+                FieldCondition(key="doc_index", range=Range(gte=section_count)),
+                *__tenant_conditions(collection_name),
+            ],
+        ),
+    )
+    return True
+
+
+def copy_document(
+    source_collection, source_document, collection_name, document, section_map, model_name=None
+):
+    """
+    Copies the vectors of an already ingested document with identical content
+    to another document, instead of computing them again.
+
+    Args:
+        section_map (Dict[int, Section]): The new section for each section id
+            of the source document.
+        model_name (str): The transformer model of the source document's vectors.
+    """
+    filter = Filter(
+        must=[
+            FieldCondition(
+                key="document_id", match=MatchValue(value=int(source_document.id))
+            ),
+            *__tenant_conditions(source_collection),
+        ],
+    )
+    sections = []
+    vectors = []
+    offset = None
+    while True:
+        records, offset = get_client().scroll(
+            collection_name=__tenant_collection(source_collection),
+            scroll_filter=filter,
+            limit=__upsert_chunk_size,
+            offset=offset,
+            with_vectors=True,
+        )
+        for record in records:
+            section = section_map.get(record.payload.get("section_id"))
+            if section is not None:
+                sections.append(section)
+                vectors.append(record.vector)
+        if offset is None:
+            break
+    __write_document(collection_name, document, sections, vectors, model_name)
+
+
+def start_model_migration(name, model_name):
+    """
+    Creates (or resumes) the migration of a user collection, or in shared
+    mode of the shared collection, to another transformer model. Its shadow
+    collection is filled by write_shadow_points and by insert_text, which
+    writes new documents to both collections until the switch.
+    """
+    tenant = __tenant_collection(name)
+    if __alias_target(tenant) is None:
+        raise RuntimeError(
+            f"Collection {tenant} predates aliases, convert it with "
+            "manage.py convert_legacy_collections first"
+        )
+    target_collection = __physical_collection(tenant, model_name)
+    migration, _ = EmbeddingMigration.objects.get_or_create(
+        tenant=tenant,
+        target_collection=target_collection,
+        status="building",
+        defaults={"target_model": model_name},
+    )
+    if not get_client().collection_exists(target_collection):
+        __recreate_collection(
+            target_collection, model_name, tenant_index=tenant == __shared_collection_name
+        )
+    return migration
+
+
+def write_shadow_points(migration, document, sections):
+    """Embeds the sections with the migration's model into its shadow collection."""
+    vectors = vectorize_cached(
+        [section.content for section in sections], migration.target_model
+    )
+    [_, user_id] = document.user.auth0_id.split("|")
+    __upsert_points(
+        migration.target_collection,
+        [
+            PointStruct(
+                id=__point_id(document, section),
+                vector=vector.tolist(),
+                payload=__point_payload(user_id, document, section),
+            )
+            for section, vector in zip(sections, vectors)
+        ],
+    )
+
+
+def switch_model_migration(migration, keep_old=False):
+    """
+    Atomically points the collection alias at the migration's shadow
+    collection. The collection must have been converted with
+    convert_legacy_collection if it predates aliases.
+    """
+    previous = __alias_target(migration.tenant)
+    if previous is None:
+        raise RuntimeError(
+            f"Collection {migration.tenant} predates aliases, convert it with "
+            "manage.py convert_legacy_collections first"
+        )
+    __switch_alias(migration.tenant, migration.target_collection)
+    migration.status = "switched"
+    migration.switched_at = timezone.now()
+    migration.save(update_fields=["status", "switched_at"])
+    if not keep_old:
+        get_client().delete_collection(collection_name=previous)
+
+
+def __write_shadow_collections(collection_name, document, sections):
+    # Documents ingested while a model migration runs go to both collections
+    sections = list(sections)
+    for migration in EmbeddingMigration.objects.filter(
+        tenant=__tenant_collection(collection_name), status="building"
+    ):
+        write_shadow_points(migration, document, sections)
+
+
+def __shadow_collections(collection_name):
+    return EmbeddingMigration.objects.filter(
+        tenant=__tenant_collection(collection_name), status="building"
+    ).values_list("target_collection", flat=True)
+
+
+def __point_id(document, section):
+    return str(uuid.uuid5(__point_namespace, f"{document.id}:{section.doc_index}"))
+
+
+def __point_payload(collection_name, document, section):
+    payload = {
+        "section_id": section.id,
+        "document_id": document.id,
+        "doc_index": section.doc_index,
+    }
+    if __is_shared():
+        payload["user_id"] = collection_name
+    if __payload_content:
+        payload["content"] = section.content
+        payload["filename"] = document.filename
+    return payload
+
+
 def __insert_points(collection_name, points):
-    __client.upsert(collection_name=collection_name, points=points)
+    if __is_shared():
+        __ensure_shared_collection()
+    __upsert_points(__tenant_collection(collection_name), points)
+
 
+def __upsert_points(collection, points):
+    if not points:
+        return
+
+    chunks = [
+        points[offset : offset + __upsert_chunk_size]
+        for offset in range(0, len(points), __upsert_chunk_size)
+    ]
+    *pending, last = chunks
+    with ThreadPoolExecutor(max_workers=__upsert_workers) as executor:
+        list(
+            executor.map(
+                lambda chunk: __upsert_chunk(collection, chunk, wait=False), pending
+            )
+        )
+    # Updates are applied in order, so once the last chunk is applied all
+    # earlier ones are as well
+    __upsert_chunk(collection, last, wait=True)
+
+
+def __upsert_chunk(collection, points, wait):
+    # One attempt plus QDRANT_UPSERT_RETRIES retries
+    for attempt in range(max(__upsert_retries, 0) + 1):
+        try:
+            get_client().upsert(collection_name=collection, points=points, wait=wait)
+            return
+        except Exception as e:
+            if attempt >= __upsert_retries:
+                raise
+            print(f"Upsert of {len(points)} points into {collection} failed, retrying: {e}")
+            time.sleep(0.5 * 2**attempt)
 
-def clean_join(tokens):
-    text = " ".join(tokens)
-    # Remove spaces before punctuation marks (commas, periods, etc.)
-    text = re.sub(r"\s([,.?!)])", r"\1", text)
-    text = re.sub(r"(\()\s", r"\1", text)
-    return text
 
 def delete_text(collection_name, document):
     filter = Filter(
@@ -116,12 +773,15 @@ def delete_text(collection_name, document):
                 key="document_id",
                 match=MatchValue(value=int(document.id)),
             ),
+            *__tenant_conditions(collection_name),
         ],
     )
     __delete_points(collection_name, filter)
 
 
 def __delete_points(collection_name, filter):
-    __client.delete(
-        collection_name=collection_name, points_selector=FilterSelector(filter=filter)
-    )
+    for collection in [__tenant_collection(collection_name), *__shadow_collections(collection_name)]:
+        get_client().delete(
+            collection_name=collection,
+            points_selector=FilterSelector(filter=filter),
+        )
@@ -0,0 +1,30 @@
+import os
+
+from qdrant_client import QdrantClient
+
+# This module must not import Django: gunicorn's post_fork hook resets the
+# client before the worker has set up Django.
+
+__client = None
+
+
+def get_client():
+    # Connected on first use: importing this module must not open a channel,
+    # e.g. in manage.py commands or before worker processes are forked
+    global __client
+    if __client is None:
+        __client = QdrantClient(
+            url=os.getenv("QDRANT_URL"),
+            api_key=os.getenv("QDRANT_SECRET"),
+            prefer_grpc=True
+        )
+    return __client
+
+
+def reset_client():
+    """
+    Drops the client without closing it, so that a forked process connects
+    anew instead of sharing the gRPC channel of its parent.
+    """
+    global __client
+    __client = None
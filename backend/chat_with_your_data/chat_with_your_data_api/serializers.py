@@ -1,7 +1,7 @@
 from rest_framework import serializers
 
-from .models import (AnonymizeEntitie, ContextEntry, Document, Room,
-                     RoomDocuments, Section, User)
+from .models import (AnonymizeEntitie, ContextEntry, Document, IngestionJob,
+                     Room, RoomDocuments, Section, User)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -13,7 +13,7 @@ class UserSerializer(serializers.ModelSerializer):
 class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
-        fields = ["id", "filename", "text", "user", "fileSize", "lang", "uploadedAt", "headings"]
+        fields = ["id", "filename", "text", "user", "fileSize", "lang", "uploadedAt", "headings", "status"]
 
 
 class ReadDocumentSerializer(serializers.ModelSerializer):
@@ -21,7 +21,20 @@ class ReadDocumentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Document
-        fields = ["id", "filename", "user", "fileSize", "lang", "uploadedAt", "headings"]
+        fields = ["id", "filename", "user", "fileSize", "lang", "uploadedAt", "headings", "status"]
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    documents = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestionJob
+        fields = ["id", "status", "documents", "timings", "error", "created_at", "started_at", "finished_at"]
+
+    def get_documents(self, obj):
+        document_ids = [file["document"] for file in obj.files]
+        documents = Document.objects.filter(id__in=document_ids).values("id", "filename", "status")
+        return list(documents)
 
 
 class SectionSerializer(serializers.ModelSerializer):
@@ -1,10 +1,12 @@
 from django.urls import path
 
 from . import views
-from .views import (DocumentApiView, FilesApiView, LanguageAPI,
-                    MessagesApiView, NextCloudApiView, NextCloudFilesApiView,
-                    RoomApiView, RoomsApiView, UpdateRoomDocumentsView,
-                    UploadApiView, UserApiView, CategorizeApiView, SummarizeApiView)
+from .views import (DocumentApiView, FilesApiView, IngestionJobApiView,
+                    LanguageAPI, MessagesApiView, MetricsApiView,
+                    NextCloudApiView,
+                    NextCloudFilesApiView, RoomApiView, RoomsApiView,
+                    UpdateRoomDocumentsView, UploadApiView, UserApiView,
+                    CategorizeApiView, SummarizeApiView)
 
 urlpatterns = [
     path("user/", UserApiView.as_view()),
@@ -20,6 +22,7 @@ urlpatterns = [
     path("categorize", CategorizeApiView.as_view()),
     path("summarize", SummarizeApiView.as_view()),
     path("documents/upload", UploadApiView.as_view()),
+    path("documents/jobs/<int:job_id>", IngestionJobApiView.as_view()),
     path(
         "documents/download/<str:filename>/", views.download_file, name="download_file"
     ),
@@ -29,4 +32,5 @@ urlpatterns = [
     path("rooms", RoomsApiView.as_view()),
     path("rooms/<str:room_id>/", RoomApiView.as_view()),
     path("messages/<str:recipient>", MessagesApiView.as_view()),
+    path("metrics", MetricsApiView.as_view()),
 ]
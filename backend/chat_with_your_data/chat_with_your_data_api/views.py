@@ -17,29 +17,30 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import metrics
+from .admission import Rejected, limits
 from .apiRateLimit import check_and_decrement_api_ratelimit
-from .embedding import (anonymize_text, detect_entities, embed_text,
-                        map_entities, return_context, vectorize, categorize, summarize_text)
-from .file_importer import extract_text, save_file
+from .anonymization import RoomEntityMapping, load_window_entities
+from .context import fetch_context_windows
+from .embedding import anonymize_text, vectorize_query, categorize, summarize_text
+from .ingestion import enqueue_upload
 from .llm import count_tokens, run_llm
 from .llmManager import LLM, llmManager
-from .models import (AnonymizeEntitie, Document, Room, RoomDocuments, Section,
-                     User)
-from .qdrant import create_collection, delete_text, insert_text, search
+from .models import (AnonymizeEntitie, Document, IngestionJob, Room,
+                     RoomDocuments, User)
+from .qdrant import (create_collection, delete_text, ensure_collection,
+                     reindex_document, search_facts, tenant_model)
 from .serializers import (AnonymizationMappingSerializer, DocumentSerializer,
-                          ReadDocumentSerializer, RoomSerializer,
-                          UserSerializer)
+                          IngestionJobSerializer, ReadDocumentSerializer,
+                          RoomSerializer, UserSerializer)
 from rest_framework.decorators import permission_classes
 from rest_framework.permissions import AllowAny
 
 LLM_MAX_TOKENS = 4098
 
-# initialize llm engine
+# initialize llm engine (cheap, the OpenAI client is imported on first use)
 myLLM = LLM(os.getenv("OPEN_AI_KEY"))
 
-# Labels for Labellist
-labellist = ["CARDINAL", "DATE", "EVENT", "FAC", "GPE", "LANGUAGE", "LAW", "LOC", "MONEY", "NORP", "ORDINAL", "ORG", "PERCENT", "PERSON", "PRODUCT", "QUANTITY", "TIME", "WORK_OF_ART", "PER", "MISC"]
-
 # initialize LLM Manager
 myllmManager = llmManager(myLLM)
 
@@ -73,6 +74,30 @@ def requires_scope(required_scope):
         return decorated
     return require_scope
 
+def admission_controlled(endpoint_class):
+    """Limits the concurrency of a view method doing heavy model work
+    Args:
+        endpoint_class (str | Callable): Key of admission.limits, or a function
+            of the URL kwargs returning one (or None to skip the limit)
+    """
+    def admission_control(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            name = endpoint_class(**kwargs) if callable(endpoint_class) else endpoint_class
+            if name is None:
+                return f(*args, **kwargs)
+            try:
+                with limits[name].admit():
+                    return f(*args, **kwargs)
+            except Rejected as e:
+                response = Response(
+                    {"error": "Too many requests, please retry later"}, status=e.status
+                )
+                response["Retry-After"] = str(e.retry_after)
+                return response
+        return decorated
+    return admission_control
+
 def download_file(request, filename):
     # Define the path to the directory where your files are stored
     files_path = "./ExampleFiles/JuraStudium"
@@ -192,6 +217,7 @@ class CategorizeApiView(APIView):
         
 class SummarizeApiView(APIView):
     @permission_classes([AllowAny])
+    @admission_controlled("summarize")
     def post(self, request, *args, **kwargs):
         """
         POST method to summarize the input text.
@@ -228,49 +254,44 @@ class SummarizeApiView(APIView):
 
 class UploadApiView(APIView):
     @permission_classes([AllowAny])
+    @admission_controlled("upload")
     def post(self, request, *args, **kwargs):
+        """
+        Queues the uploaded files for ingestion and returns their documents
+        in the "processing" state together with the job id.
+        """
         auth0_id = request.POST.get("user")
         user = User.objects.get(auth0_id=auth0_id)
         files = request.FILES.getlist("files")
-        Path("../temp").mkdir(parents=True, exist_ok=True)
 
-        documents = []
-        success = True
+        job, documents = enqueue_upload(user, files)
 
-        for file in files:
-            file_size = file.size
-            temp_file_path = save_file("../temp", file)
-            text = extract_text(temp_file_path, file.name)
-            os.remove(temp_file_path)
-
-            document_data = {
-                "filename": file.name,
-                "text": text,
-                "user": user.id,
-                "lang": user.lang,
-                "fileSize": file_size,
-            }
+        response = []
+        for document in DocumentSerializer(documents, many=True).data:
+            document["job"] = job.id
+            response.append(document)
+        return Response(response, status=status.HTTP_202_ACCEPTED)
 
-            serializer = DocumentSerializer(data=document_data)
-            if serializer.is_valid():
-                result = serializer.save()
-                documents.append(serializer.data)
-
-                [_, id] = user.auth0_id.split("|")
-                qdrant_result = insert_text(id, result, user.lang)
-                if not qdrant_result:
-                    success = False
-                    break
-            else:
-                success = False
-                break
 
-        if not success:
-            for doc in documents:
-                Document.objects.filter(id=doc["id"]).delete()
-            return Response("File upload failed", status=status.HTTP_400_BAD_REQUEST)
-        else:
-            return Response(documents, status=status.HTTP_201_CREATED)
+class IngestionJobApiView(APIView):
+    @permission_classes([AllowAny])
+    def get(self, request, job_id, *args, **kwargs):
+        try:
+            job = IngestionJob.objects.get(id=job_id)
+            serializer = IngestionJobSerializer(job)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        except IngestionJob.DoesNotExist:
+            return Response(
+                {"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+
+
+class MetricsApiView(APIView):
+    def get(self, request, *args, **kwargs):
+        # Per worker process: inference queue depth, queue wait and inference times
+        return Response(
+            {"pid": os.getpid(), **metrics.snapshot()}, status=status.HTTP_200_OK
+        )
 
 
 class RoomNamesApiView(APIView):
@@ -456,6 +477,7 @@ class UpdateRoomDocumentsView(APIView):
 
 class MessagesApiView(APIView):
     @permission_classes([AllowAny])
+    @admission_controlled(lambda recipient, **kwargs: "search" if recipient == "search" else None)
     def post(self, request, recipient, *args, **kwargs):
         current_time = timezone.now().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
         auth0_id = request.data.get("user", {}).get("auth0_id")
@@ -469,93 +491,48 @@ class MessagesApiView(APIView):
             room_id = request.data.get("room", {}).get("id")
 
             user = User.objects.get(auth0_id=auth0_id)
-            vector = vectorize(question)
+            vector = vectorize_query(question, model_name=tenant_model(id))
 
             room = Room.objects.get(id=room_id)
-            roomDocs = RoomDocuments.objects.filter(room=room)
-
-            roomDocsList = []
-            for line in roomDocs:
-                roomDocsList.append(line.document.id)
+            roomDocsList = list(
+                RoomDocuments.objects.filter(room=room).values_list(
+                    "document_id", flat=True
+                )
+            )
 
             try:
-                search_results = search(id, vector, roomDocsList)
+                hits = search_facts(id, vector, roomDocsList)
             except Exception:
                 return Response("Search Error", status.HTTP_400_BAD_REQUEST)
 
-            facts = []
-            counter = {}
-            actual_entities = []
-            for search_result in search_results:
-                section = Section.objects.get(
-                    id=search_result.payload.get("section_id")
-                )
-                embedded_text = embed_text(section.document.text, user.lang)
-                (before_result, after_result) = return_context(
-                    embedded_text,
-                    section.doc_index,
-                    room.settings.get("pre_phrase_count"),
-                    room.settings.get("post_phrase_count"),
-                )
+            hit_keys = [(hit["document_id"], hit["doc_index"]) for hit in hits]
+            range_before = room.settings.get("pre_phrase_count", 2)
+            range_after = room.settings.get("post_phrase_count", 2)
+            contexts = fetch_context_windows(hit_keys, range_before, range_after)
 
-                # Detect entities using Spacy
-                entities = []
-                for ent in embedded_text.ents:
-                    entity_info = {
-                        "TEXT": ent.text,
-                        "START_CHAR": ent.start_char,
-                        "END_CHAR": ent.end_char,
-                        "LABEL": ent.label_,
-                    }
-                    entities.append(entity_info)
-
-                text = section.content
-
-                # Detect entities using Spacy
-                ner_entities = detect_entities(embedded_text, user.lang)
-                
-                # Get actual counters from db
-                for label in labellist:
-                    precounter_query = AnonymizeEntitie.objects.filter(
-                        entityType=label, roomID=room
-                    ).order_by("-counter")[:1]
-
-                    if len(precounter_query) == 0:
-                        precounter_value = 0
-                    else:
-                        precounter_value = precounter_query[0].counter + 1
-
-                    counter[label] = precounter_value
-
-                
-
-                entity_mapping = map_entities(ner_entities, text, counter)
-                
-                for entry in entity_mapping:
-                    # Check if mapping already exists
-                    try:
-                        go = AnonymizeEntitie.objects.get(
-                            deanonymized=entry, roomID=room
-                        )
-                    except AnonymizeEntitie.DoesNotExist:
-                        # Create model if not already existing
-                        AnonymizeEntitie.objects.create(
-                            roomID=room,
-                            anonymized=entity_mapping[entry],
-                            deanonymized=entry,
-                            entityType=str(entity_mapping[entry]).split("_")[0],
-                            counter=str(entity_mapping[entry]).split("_")[1],
-                        )
+            # Entities were detected by spaCy at ingest; the context windows
+            # are anonymized with the same mapping as the hits
+            entity_mapping = RoomEntityMapping(room)
+            for entity in load_window_entities(hit_keys, range_before, range_after):
+                entity_mapping.add(entity.text, entity.label)
+
+            facts = []
+            for hit in hits:
+                (before_result, after_result) = contexts[
+                    (hit["document_id"], hit["doc_index"])
+                ]
 
                 fact = {
-                    "content": text + " ",
-                    "fileName": section.document.filename,
-                    "accuracy": search_result.score,
+                    "content": hit["content"] + " ",
+                    "fileName": hit["filename"],
+                    "accuracy": hit["score"],
                     "context_before": before_result + " ",
                     "context_after":  after_result + " ",
                 }
                 facts.append(fact)
 
+            entity_mapping.save()
+
             user_serialized = UserSerializer(user).data
             room_serialized = RoomSerializer(room).data
 
@@ -761,19 +738,23 @@ class LanguageAPI(APIView):
 
 class FilesApiView(APIView):
     @permission_classes([AllowAny])
+    @admission_controlled("reload")
     def post(self, request, *args, **kwargs):
+        """
+        Re-ingests the documents of a user whose text, language or embedding
+        model changed since they were indexed.
+        """
         auth0_id = request.data["auth0_id"]
         user = User.objects.get(auth0_id=auth0_id)
         [_, id] = auth0_id.split("|")
-        create_collection(id)
+        ensure_collection(id)
 
-        documents = Document.objects.filter(user=user)
+        documents = Document.objects.filter(user=user, status="ready")
         success = True
         for document in documents:
-            Section.objects.filter(document=document).delete()
-
-            qdrant_result = insert_text(id, document, document.lang)
-            if qdrant_result != True:
+            try:
+                reindex_document(id, document)
+            except Exception:
                 success = False
 
         if success:
@@ -0,0 +1,57 @@
+import os
+
+# With GUNICORN_PRELOAD=1 the app and its models are loaded once in the
+# master, and the workers share the weights copy-on-write after the fork
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+if preload_app:
+    # The master imports ssl (through requests and transformers) before the
+    # gevent workers would patch it, which breaks HTTPS calls in the workers
+    from gevent import monkey
+
+    monkey.patch_all()
+
+import gc
+import multiprocessing
+import sys
+
+# Loaded by gunicorn from the working directory (see entrypoint.sh)
+
+bind = "[::]:8000"
+workers = int(os.getenv("WEB_WORKERS", 1))
+worker_class = "gevent"
+timeout = 120
+
+
+def when_ready(server):
+    # Runs in the master before the workers are forked
+    if not preload_app or os.getenv("INFERENCE_SOCKET"):
+        return
+    from chat_with_your_data_api.embedding import warm_up
+
+    names = os.getenv("GUNICORN_WARM_UP", "de,en,transformer,summarizer")
+    warm_up([name for name in names.split(",") if name])
+    # Objects that survive to here are never freed; keeping them out of the
+    # collector stops it from touching (and so copying) their pages in workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Runs before the worker sets up Django, so only Django-free modules here
+    from chat_with_your_data_api.qdrant_connection import reset_client
+
+    reset_client()
+    if not os.getenv("INFERENCE_SOCKET"):
+        # Without a limit every worker starts one thread per core
+        threads = int(os.getenv("TORCH_THREADS", 0)) or max(
+            multiprocessing.cpu_count() // workers, 1
+        )
+        if "torch" in sys.modules:
+            # Preloaded by the master
+            from chat_with_your_data_api.embedding import set_torch_threads
+
+            set_torch_threads(threads)
+        else:
+            # Read by torch when a model is first loaded, importing it here
+            # would cost every worker seconds at boot
+            os.environ["OMP_NUM_THREADS"] = str(threads)
@@ -6,6 +6,8 @@ cd chat_with_your_data/
 
 python manage.py migrate
 
+python manage.py process_ingestion_jobs --workers ${INGEST_WORKERS:-2} &
+
 python manage.py runserver 0.0.0.0:8000
 
 exec "$@"
\ No newline at end of file
@@ -6,6 +6,15 @@ cd chat_with_your_data/
 
 python manage.py migrate
 
-gunicorn --bind [::]:8000 --workers 1 --worker-class=gevent  --timeout 120 chat_with_your_data.wsgi
+# With INFERENCE_SOCKET set, one inference server holds the models and the
+# web and ingestion workers call it, so WEB_WORKERS can be raised
+if [ -n "$INFERENCE_SOCKET" ]; then
+    python manage.py inference_server &
+fi
+
+python manage.py process_ingestion_jobs --workers ${INGEST_WORKERS:-2} &
+
+# Bind address, workers and preloading are set in gunicorn.conf.py
+gunicorn chat_with_your_data.wsgi
 
 exec "$@"
\ No newline at end of file
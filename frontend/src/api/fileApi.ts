@@ -1,5 +1,5 @@
 import Request from './Request';
-import { File } from '../models/File';
+import { File, IngestionJob } from '../models/File';
 
 export async function getFiles(auth0_id: string): Promise<File[]> {
   return Request<File[]>({
@@ -22,6 +22,13 @@ export async function createFiles(data: FormData): Promise<File[]> {
   });
 }
 
+export async function getIngestionJob(jobId: number): Promise<IngestionJob> {
+  return Request<IngestionJob>({
+    url: `/api/documents/jobs/${jobId}`,
+    method: 'GET'
+  });
+}
+
 export function deleteFiles(fileIds: string[]): Promise<void> {
   return Request<void>({
     url: '/api/documents',
@@ -20,9 +20,17 @@ import NextCloudIcon from './NextCloudIcon.svg?react';
 import UploadButton from './UploadButton';
 import { useUser } from '../../../context/UserProvider';
 import { File as FileType } from '../../../models/File';
-import { getFiles, createFiles, deleteFiles } from '../../../api/fileApi';
+import {
+  getFiles,
+  createFiles,
+  deleteFiles,
+  getIngestionJob
+} from '../../../api/fileApi';
 import { useToast } from '../../../context/ToastProvider';
 
+// Uploaded files are extracted and embedded by a background job
+const JOB_POLL_INTERVAL = 2000;
+
 export const FileExplorer = () => {
   const styles = FileExplorerStyles();
   const { t } = useTranslation();
@@ -54,6 +62,37 @@ export const FileExplorer = () => {
     getAllDocuments();
   }, [user, showToast, t]);
 
+  const pollIngestionJob = (jobId: number) => {
+    getIngestionJob(jobId)
+      .then((job) => {
+        if (job.status === 'queued' || job.status === 'processing') {
+          setTimeout(() => pollIngestionJob(jobId), JOB_POLL_INTERVAL);
+          return;
+        }
+
+        if (job.status === 'done') {
+          setFiles((prevFiles) =>
+            prevFiles.map((file) =>
+              file.job === jobId
+                ? { ...file, status: 'ready', isUploading: false }
+                : file
+            )
+          );
+          showToast(t('fileProcessingSuccess'), 'success');
+        } else {
+          // A failed job removes all of its documents
+          setFiles((prevFiles) => prevFiles.filter((file) => file.job !== jobId));
+          showToast(
+            `${t('errorProcessingFiles')}: ${job.error || t('unexpectedErrorOccurred')}`,
+            'error'
+          );
+        }
+      })
+      .catch(() => {
+        setTimeout(() => pollIngestionJob(jobId), JOB_POLL_INTERVAL);
+      });
+  };
+
   const handleFileUpload = (selectedFiles: FileList) => {
     const formData = new FormData();
     const tempFiles: FileType[] = [];
@@ -77,10 +116,20 @@ export const FileExplorer = () => {
             const updatedFile = response.find(
               (resFile) => resFile.filename === file.filename
             );
-            return updatedFile ? { ...updatedFile, isUploading: false } : file;
+            return updatedFile
+              ? {
+                  ...updatedFile,
+                  isUploading: updatedFile.status === 'processing'
+                }
+              : file;
           })
         );
         showToast(t('fileUploadSuccess'), 'success');
+
+        const jobIds = new Set(
+          response.map((file) => file.job).filter((job) => job !== undefined)
+        );
+        jobIds.forEach((jobId) => pollIngestionJob(jobId as number));
       })
       .catch((error) => {
         setFiles((prevFiles) => prevFiles.filter((file) => !file.isUploading));
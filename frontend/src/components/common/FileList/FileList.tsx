@@ -60,7 +60,9 @@ export const FileList = ({
         return '';
       },
       renderCell: (file) => {
-        return file.isUploading ? <Spinner size="tiny" /> : null;
+        return file.isUploading || file.status === 'processing' ? (
+          <Spinner size="tiny" />
+        ) : null;
       }
     }),
     createTableColumn<File>({
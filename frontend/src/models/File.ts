@@ -9,9 +9,18 @@ export type File = {
   fileSize: number;
   uploadedAt?: Date;
   isUploading?: boolean;
+  status?: 'processing' | 'ready' | 'failed';
+  job?: number;
   headings?: { line: number; heading: string; summary?: string }[];
 };
 
+export type IngestionJob = {
+  id: number;
+  status: 'queued' | 'processing' | 'done' | 'failed';
+  error?: string;
+  documents: { id: number; filename: string; status: File['status'] }[];
+};
+
 export type FileResponse = {
   error?: string;
   files: File[];